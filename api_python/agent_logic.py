@@ -1,12 +1,15 @@
 import os
+import asyncio
 import json
 import csv
 import sqlite3
 import logging
 import shutil
+import threading
+import time
 import re
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, List, Any, Optional, Tuple, Union
 from uuid import uuid4
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, field_validator
@@ -14,20 +17,51 @@ from langchain.chat_models import init_chat_model
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.graph import StateGraph, END
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import pickle
 import requests
+from requests.adapters import HTTPAdapter
+import orjson
+import zstandard
+import httpx
+from bs4 import BeautifulSoup
+try:
+    import lxml.html as lxml_html
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_html = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+    GOOGLE_TRANSIENT_ERRORS = (ResourceExhausted, ServiceUnavailable)
+except ImportError:
+    GOOGLE_TRANSIENT_ERRORS = ()
 from tenacity import retry, stop_after_attempt, wait_exponential
 from cachetools import TTLCache
 import traceback
 import argparse
+import functools
+import atexit
+import contextvars
+import copy
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# The graph, vector-store and retrieval stacks are imported where they are used so that a cold start
+# serving only /chat does not pay for them.
+if TYPE_CHECKING:
+    from langgraph.graph import StateGraph
+    from langchain_community.vectorstores import FAISS
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 
 # Configure logging
+# Messages below a logger's level (DEBUG on `logger`, WARNING on `error_logger`) use %-style arguments so they are never formatted.
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
@@ -47,17 +81,93 @@ error_logger.propagate = False
 
 
 
-# Set USER_AGENT early for WebBaseLoader
+# Set USER_AGENT early for outbound page fetches
 if "USER_AGENT" not in os.environ:
     os.environ["USER_AGENT"] = "MarketIntelligenceAgent/1.0 (+http://example.com/botinfo)"
     logger.info(f"Default USER_AGENT set to: {os.environ['USER_AGENT']}")
 
+# Charts are only ever written to files; pin matplotlib to the non-GUI Agg backend before anything imports pyplot
+os.environ.setdefault("MPLBACKEND", "Agg")
+
 load_dotenv()
 
-search_results_cache = TTLCache(maxsize=100, ttl=3600)
+# One cache per provider so a burst of news lookups cannot evict financial data (and vice versa).
+tavily_search_cache = TTLCache(maxsize=128, ttl=3600)
+serpapi_search_cache = TTLCache(maxsize=128, ttl=3600)
+newsapi_search_cache = TTLCache(maxsize=128, ttl=3600)
+mediastack_search_cache = TTLCache(maxsize=128, ttl=3600)
+fmp_data_cache = TTLCache(maxsize=128, ttl=3600)
+alphavantage_data_cache = TTLCache(maxsize=128, ttl=3600)
+# Parsed pages, checked before any network round trip; page_cache in SQLite still serves conditional requests.
+url_content_cache = TTLCache(maxsize=500, ttl=6 * 3600)
+# Completed agent runs, keyed by query/domain/question plus a fingerprint of the provider keys in use.
+agent_run_cache = TTLCache(maxsize=128, ttl=3600)
+AGENT_RUN_CACHE_ENV_VARS = ("TAVILY_API_KEY", "GOOGLE_API_KEY", "SERPAPI_API_KEY", "NEWS_API_KEY", "MEDIASTACK_API_KEY", "FINANCIAL_MODELING_PREP_API_KEY", "ALPHA_VANTAGE_API_KEY")
+
+# Shared keep-alive pool for the provider REST APIs; sized to the provider thread pool.
+provider_http_session = requests.Session()
+provider_http_session.headers.update({"Accept": "application/json"})
+_provider_http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+provider_http_session.mount("https://", _provider_http_adapter)
+provider_http_session.mount("http://", _provider_http_adapter)
+
+# Provider fetchers run concurrently in run_provider_tasks; TTLCache itself is not thread-safe.
+_provider_cache_lock = threading.Lock()
+
+def _cache_key(query: str) -> str:
+    return query.strip().lower()
+
+def cache_get(provider_cache: TTLCache, cache_key: str) -> Optional[Any]:
+    with _provider_cache_lock:
+        return provider_cache.get(cache_key)
+
+def cache_put(provider_cache: TTLCache, cache_key: str, cache_value: Any):
+    with _provider_cache_lock:
+        provider_cache[cache_key] = cache_value
+
+def locked_singleton(builder):
+    # lru_cache alone lets two threads build the same value concurrently (e.g. prewarm racing the first request);
+    # the lock serialises the first build and the lru_cache is checked again once it is held.
+    cached_builder = functools.lru_cache(maxsize=1)(builder)
+    build_lock = threading.Lock()
+
+    @functools.wraps(builder)
+    def get_singleton():
+        if cached_builder.cache_info().currsize:
+            return cached_builder()
+        with build_lock:
+            return cached_builder()
+    get_singleton.cache_clear = cached_builder.cache_clear
+    return get_singleton
+
+_SYMBOL_RE = re.compile(r'\b([A-Z]{1,5})\b')
+_DOMAIN_RE = re.compile(r'^[a-zA-Z0-9\s-]+$')
+_SLUG_RE = re.compile(r'[^a-zA-Z0-9_-]')
+_BLANKS_RE = re.compile(r'\n\s*\n')
+_JSON_FENCE_RE = re.compile(r"```json\s*([\s\S]*?)\s*```", re.IGNORECASE)
+
+DATA_SOURCE_CSV_FIELDS = ("title", "summary", "url", "source", "full_content")
+CSV_WRITE_BUFFER_BYTES = 1 << 20
+# LangGraph/LangChain stacks run deep; the innermost frames are the ones that locate a workflow failure
+CRITICAL_TRACEBACK_FRAME_LIMIT = 50
+# Error reports embed full tracebacks; a 128 KiB buffer lets the single write land in one syscall on close
+ERROR_REPORT_BUFFER_BYTES = 1 << 17
+URL_FETCH_CONCURRENCY = 8
+# httpx's timeout is per network operation; this bounds the whole fetch (slow-drip bodies, redirects, parsing)
+URL_FETCH_TIMEOUT_SECONDS = 20
+PROVIDER_FETCH_WORKERS = 8
+# Failures worth resuming a workflow from its last checkpoint; anything else would just fail the same step again
+TRANSIENT_WORKFLOW_ERRORS = (httpx.TimeoutException, httpx.TransportError) + GOOGLE_TRANSIENT_ERRORS
+# Set while run_market_intelligence_agent resumes a run; nodes then fall back to their defaults instead of failing again
+_workflow_resuming = contextvars.ContextVar("workflow_resuming", default=False)
+
+def raise_if_resumable(exc: Exception):
+    # LLM nodes call this first in their except blocks, so a transient failure reaches the checkpoint resume
+    if isinstance(exc, TRANSIENT_WORKFLOW_ERRORS) and not _workflow_resuming.get():
+        raise exc
 
 def get_api_key(service_name: str, user_id: Optional[str] = None) -> Optional[str]:
-    logger.debug(f"Retrieving API key for service: {service_name}, UserID: {user_id if user_id else 'N/A'}")
+    logger.debug("Retrieving API key for service: %s, UserID: %s", service_name, user_id or 'N/A')
     env_var_map = {
         "TAVILY": "TAVILY_API_KEY",
         "SERPAPI": "SERPAPI_API_KEY",
@@ -74,11 +184,145 @@ def get_api_key(service_name: str, user_id: Optional[str] = None) -> Optional[st
     logger.warning(f"API key not found for service: {service_name} (looked for {env_var_name})")
     return None
 
+# journal_mode=WAL is persisted in the database file; the rest are per-connection settings.
+SQLITE_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=1073741824",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+    # Truncate the WAL back to ~6 MB after checkpoints so large state blobs do not leave it permanently grown
+    "PRAGMA journal_size_limit=6144000",
+)
+
+def _connect(db_path: str, **connect_kwargs: Any) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, **connect_kwargs)
+    for pragma_stmt in SQLITE_CONNECTION_PRAGMAS:
+        conn.execute(pragma_stmt)
+    return conn
+
+# WITHOUT ROWID makes (session_id, timestamp) the clustered key, so history loads walk one B-tree in order.
+CHAT_HISTORY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        session_id TEXT,
+        message_type TEXT,
+        content TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (session_id, timestamp)
+    ) WITHOUT ROWID
+'''
+
+def migrate_chat_history_without_rowid(cursor_obj: sqlite3.Cursor):
+    table_row = cursor_obj.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chat_history'").fetchone()
+    if not table_row or "WITHOUT ROWID" in table_row[0].upper():
+        return
+    logger.info("Migrating chat_history to a WITHOUT ROWID table.")
+    cursor_obj.execute("DROP TABLE IF EXISTS chat_history_new")
+    cursor_obj.execute(CHAT_HISTORY_TABLE_SQL.format(table_name="chat_history_new"))
+    cursor_obj.execute(
+        "INSERT OR IGNORE INTO chat_history_new (session_id, message_type, content, timestamp) "
+        "SELECT session_id, message_type, content, timestamp FROM chat_history WHERE session_id IS NOT NULL AND timestamp IS NOT NULL"
+    )
+    cursor_obj.execute("DROP TABLE chat_history")
+    cursor_obj.execute("ALTER TABLE chat_history_new RENAME TO chat_history")
+
+# Cache tables are pruned by age so the database does not grow without bound. A page body is kept while a page_cache
+# entry may point at it (both are refreshed whenever the page is fetched or stored again) and for as long as any
+# persisted state references it through state_page_refs, since saved states carry only its content_id.
+PAGE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+EMBEDDING_CACHE_TTL_SECONDS = 30 * 24 * 3600
+CHAT_SEMANTIC_CACHE_TTL_SECONDS = 3600
+CACHE_PRUNE_INTERVAL_SECONDS = 3600
+_last_cache_prune_ts = 0.0
+_cache_prune_lock = threading.Lock()
+
+def add_stored_at_column(cursor_obj: sqlite3.Cursor, table_name: str):
+    # Tables created before TTL pruning existed; their rows start their TTL at migration time
+    table_columns = {column_row[1] for column_row in cursor_obj.execute(f"PRAGMA table_info({table_name})")}
+    if "stored_at" in table_columns:
+        return
+    logger.info(f"Adding stored_at to {table_name}.")
+    cursor_obj.execute(f"ALTER TABLE {table_name} ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+    cursor_obj.execute(f"UPDATE {table_name} SET stored_at = ?", (time.time(),))
+
+def prune_cache_tables(conn: sqlite3.Connection):
+    now_ts = time.time()
+    with conn:
+        pruned_pages = conn.execute("DELETE FROM page_cache WHERE fetched_at < datetime('now', ?)", (f"-{PAGE_CACHE_TTL_SECONDS} seconds",)).rowcount
+        pruned_bodies = conn.execute(
+            "DELETE FROM page_contents WHERE stored_at < ? AND NOT EXISTS (SELECT 1 FROM state_page_refs WHERE state_page_refs.content_id = page_contents.content_id)",
+            (now_ts - PAGE_CACHE_TTL_SECONDS,)
+        ).rowcount
+        pruned_vectors = conn.execute("DELETE FROM embedding_cache WHERE stored_at < ?", (now_ts - EMBEDDING_CACHE_TTL_SECONDS,)).rowcount
+        pruned_answers = conn.execute("DELETE FROM chat_response_cache WHERE created_at < ?", (now_ts - CHAT_SEMANTIC_CACHE_TTL_SECONDS,)).rowcount
+    if pruned_pages or pruned_bodies or pruned_vectors or pruned_answers:
+        logger.info(f"Cache prune: removed {pruned_pages} page_cache, {pruned_bodies} page_contents, {pruned_vectors} embedding_cache and {pruned_answers} chat_response_cache rows.")
+
+STATE_PAGE_REF_FIELDS = ("raw_news_data", "competitor_data")
+
+def state_page_content_ids(state_items: Iterable[Dict[str, Any]]) -> set:
+    return {state_item["content_id"] for state_item in state_items if isinstance(state_item, dict) and state_item.get("content_id")}
+
+def backfill_state_page_refs(cursor_obj: sqlite3.Cursor):
+    # States saved before state_page_refs existed only record their content_ids inside the compressed field blobs
+    decompressor = zstandard.ZstdDecompressor()
+    ref_rows = []
+    field_placeholders = ",".join("?" * len(STATE_PAGE_REF_FIELDS))
+    for state_id, field_data in cursor_obj.execute(f"SELECT state_id, field_data FROM state_fields WHERE field_name IN ({field_placeholders})", STATE_PAGE_REF_FIELDS).fetchall():
+        field_value = orjson.loads(decompressor.decompress(field_data))
+        if isinstance(field_value, list):
+            ref_rows.extend((content_id, state_id) for content_id in state_page_content_ids(field_value))
+    if ref_rows:
+        logger.info(f"Backfilling {len(ref_rows)} state page references.")
+        cursor_obj.executemany("INSERT OR IGNORE INTO state_page_refs (content_id, state_id) VALUES (?, ?)", ref_rows)
+
+def maybe_prune_cache_tables():
+    global _last_cache_prune_ts
+    with _cache_prune_lock:
+        if time.time() - _last_cache_prune_ts < CACHE_PRUNE_INTERVAL_SECONDS:
+            return
+        _last_cache_prune_ts = time.time()
+    try:
+        prune_cache_tables(_get_conn())
+    except Exception as e_prune:
+        error_logger.error(f"Failed to prune cache tables: {e_prune}")
+
+ANALYSIS_JOB_INTERRUPTED_ERROR = "Analysis job was interrupted before it finished (the server process stopped)."
+
+def is_process_alive(pid_val: int) -> bool:
+    if os.name == "nt":
+        # Signal 0 is CTRL_C_EVENT on Windows; only one worker process is supported there
+        return False
+    try:
+        os.kill(pid_val, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def fail_interrupted_analysis_jobs(cursor_obj: sqlite3.Cursor):
+    # Jobs run as tasks inside the process that accepted them; if that process is gone they will never finish.
+    # This process has not started any job yet, so a row carrying its own pid belongs to an earlier process.
+    unfinished_jobs = cursor_obj.execute("SELECT job_id, owner_pid FROM analysis_jobs WHERE status IN ('queued', 'running')").fetchall()
+    interrupted_job_ids = [job_id for job_id, owner_pid in unfinished_jobs if not owner_pid or owner_pid == os.getpid() or not is_process_alive(owner_pid)]
+    if not interrupted_job_ids:
+        return
+    logger.info(f"Marking {len(interrupted_job_ids)} interrupted analysis jobs as failed.")
+    interrupted_result = orjson.dumps({"success": False, "error": ANALYSIS_JOB_INTERRUPTED_ERROR})
+    cursor_obj.executemany(
+        "UPDATE analysis_jobs SET status = 'failed', result_data = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+        [(interrupted_result, job_id) for job_id in interrupted_job_ids]
+    )
+
 def init_db():
     db_name = 'market_intelligence_agent.db'
     db_path = ""
     try:
-        if os.environ.get("VERCEL_ENV"):
+        if os.environ.get("AGENT_DB_PATH"):
+            db_path = os.environ["AGENT_DB_PATH"]
+            logger.info(f"Using AGENT_DB_PATH for database: {db_path}")
+        elif os.environ.get("VERCEL_ENV"):
             db_path = os.path.join("/tmp", db_name)
             logger.info(f"Using Vercel /tmp path for database: {db_path}")
         else:
@@ -86,27 +330,92 @@ def init_db():
             db_path = os.path.join(api_python_dir, db_name)
             logger.info(f"Using local path for database: {db_path}")
 
-        conn = sqlite3.connect(db_path)
+        conn = _connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor_obj = conn.cursor()
         cursor_obj.execute('''
             CREATE TABLE IF NOT EXISTS states (
                 id TEXT PRIMARY KEY,
                 market_domain TEXT,
                 query TEXT,
-                state_data TEXT,
+                state_data BLOB,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        migrate_chat_history_without_rowid(cursor_obj)
+        cursor_obj.execute(CHAT_HISTORY_TABLE_SQL.format(table_name="chat_history"))
         cursor_obj.execute('''
-            CREATE TABLE IF NOT EXISTS chat_history (
-                session_id TEXT,
-                message_type TEXT,
-                content TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (session_id, timestamp)
+            CREATE TABLE IF NOT EXISTS page_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                page_data TEXT,
+                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # One row per state field, so nodes re-persist only the fields they changed.
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS state_fields (
+                state_id TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                field_data BLOB,
+                PRIMARY KEY (state_id, field_name)
+            ) WITHOUT ROWID
+        ''')
+        state_page_refs_exists = cursor_obj.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'state_page_refs'").fetchone()
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS state_page_refs (
+                content_id TEXT NOT NULL,
+                state_id TEXT NOT NULL,
+                PRIMARY KEY (content_id, state_id)
+            ) WITHOUT ROWID
+        ''')
+        if not state_page_refs_exists:
+            backfill_state_page_refs(cursor_obj)
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS page_contents (
+                content_id TEXT PRIMARY KEY,
+                body BLOB,
+                stored_at REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        add_stored_at_column(cursor_obj, "page_contents")
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                result_data BLOB,
+                owner_pid INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        if "owner_pid" not in {column_row[1] for column_row in cursor_obj.execute("PRAGMA table_info(analysis_jobs)")}:
+            cursor_obj.execute("ALTER TABLE analysis_jobs ADD COLUMN owner_pid INTEGER")
+        fail_interrupted_analysis_jobs(cursor_obj)
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS chat_response_cache (
+                session_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                question TEXT,
+                answer TEXT,
+                embedding BLOB,
+                context_digest TEXT,
+                PRIMARY KEY (session_id, created_at)
+            ) WITHOUT ROWID
+        ''')
+        if "context_digest" not in {column_row[1] for column_row in cursor_obj.execute("PRAGMA table_info(chat_response_cache)")}:
+            cursor_obj.execute("ALTER TABLE chat_response_cache ADD COLUMN context_digest TEXT")
+        cursor_obj.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                content_hash TEXT PRIMARY KEY,
+                vector BLOB,
+                stored_at REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        add_stored_at_column(cursor_obj, "embedding_cache")
         conn.commit()
+        prune_cache_tables(conn)
         conn.close()
         logger.info(f"Database '{db_path}' initialized/verified successfully.")
     except Exception as e_db_init:
@@ -131,13 +440,16 @@ class MarketIntelligenceState(BaseModel):
     state_id: str = Field(default_factory=lambda: str(uuid4()))
     report_dir: Optional[str] = None
     chart_paths: List[str] = Field(default_factory=list)
+    report_generated_ok: bool = False
 
+    # Validators run when a state is built from user input or loaded from the database. Nodes assign
+    # internally generated values, so assignments are not re-validated.
     @field_validator('market_domain')
     @classmethod
     def validate_market_domain_value(cls, v_domain: str) -> str:
         if not v_domain:
             raise ValueError("Market domain cannot be empty.")
-        if not re.match(r'^[a-zA-Z0-9\s-]+$', v_domain):
+        if not _DOMAIN_RE.match(v_domain):
             raise ValueError("Market domain must contain only letters, numbers, spaces, or hyphens.")
         return v_domain.strip()
 
@@ -148,28 +460,137 @@ class MarketIntelligenceState(BaseModel):
             raise ValueError("Query must be at least 3 characters long if provided.")
         return v_query.strip() if v_query else None
 
-    class Config:
-        validate_assignment = True
+    # Used in every report/data filename; neither source field changes after the state is built
+    @functools.cached_property
+    def domain_slug(self) -> str:
+        return self.market_domain.lower().replace(' ', '_')
+
+    @functools.cached_property
+    def short_state_id(self) -> str:
+        return self.state_id[:4]
+
+    # Shared by the workflow nodes and the API response so the filenames cannot drift apart
+    @functools.cached_property
+    def report_basename(self) -> str:
+        return f"{self.domain_slug}_report_{self.short_state_id}.md"
+
+    @functools.cached_property
+    def data_json_basename(self) -> str:
+        return f"{self.domain_slug}_data_sources.json"
+
+    @functools.cached_property
+    def data_csv_basename(self) -> str:
+        return f"{self.domain_slug}_data_sources.csv"
+
+    @functools.cached_property
+    def rag_log_basename(self) -> str:
+        return f"rag_responses_{self.short_state_id}.log"
+
+    # Not cached: vector_store_path is assigned by setup_vector_store after the state exists
+    @property
+    def vector_store_dirname(self) -> Optional[str]:
+        return os.path.basename(self.vector_store_path) if self.vector_store_path else None
 
 def get_db_path():
     db_name = 'market_intelligence_agent.db'
+    if os.environ.get("AGENT_DB_PATH"):
+        return os.environ["AGENT_DB_PATH"]
     if os.environ.get("VERCEL_ENV"):
         return os.path.join("/tmp", db_name)
     else:
         api_python_dir = os.path.dirname(os.path.abspath(__file__))
         return os.path.join(api_python_dir, db_name)
 
-def save_state(state_obj: MarketIntelligenceState):
+_db_local = threading.local()
+# Every pooled connection by owning thread id, so connections of finished threads and the rest at exit can be closed.
+# Each connection is still only used by its own thread; check_same_thread=False only permits closing it from elsewhere.
+_pooled_conns: Dict[int, sqlite3.Connection] = {}
+_pooled_conns_lock = threading.Lock()
+
+def _close_conns(conns_to_close: List[sqlite3.Connection]):
+    for pooled_conn in conns_to_close:
+        try:
+            pooled_conn.close()
+        except Exception as e_close_conn:
+            error_logger.error(f"Failed to close pooled SQLite connection: {e_close_conn}")
+
+def _get_conn() -> sqlite3.Connection:
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = _connect(get_db_path(), check_same_thread=False)
+        _db_local.conn = conn
+        live_thread_ids = {thread_obj.ident for thread_obj in threading.enumerate()}
+        with _pooled_conns_lock:
+            stale_conns = [_pooled_conns.pop(thread_id) for thread_id in list(_pooled_conns) if thread_id not in live_thread_ids]
+            _pooled_conns[threading.get_ident()] = conn
+        _close_conns(stale_conns)
+    return conn
+
+@atexit.register
+def close_pooled_conns():
+    with _pooled_conns_lock:
+        conns_to_close = list(_pooled_conns.values())
+        _pooled_conns.clear()
+    _close_conns(conns_to_close)
+
+# market_data_collector stores the same article list as both raw_news_data and competitor_data;
+# persist it once and re-point competitor_data on load.
+COMPETITOR_DATA_ALIAS_KEY = "_competitor_data_is_raw_news_data"
+COMPETITOR_DATA_ALIAS_JSON = orjson.dumps({COMPETITOR_DATA_ALIAS_KEY: True})
+
+STATE_ZSTD_LEVEL = 3
+
+def encode_state_fields(state_obj: MarketIntelligenceState, field_names: Iterable[str]) -> List[Tuple[str, bytes]]:
+    field_names = set(field_names)
+    state_payload = state_obj.model_dump(include=field_names)
+    if "competitor_data" in state_payload and state_obj.competitor_data and (state_obj.competitor_data is state_obj.raw_news_data or state_obj.competitor_data == state_obj.raw_news_data):
+        state_payload["competitor_data"] = {COMPETITOR_DATA_ALIAS_KEY: True}
+    compressor = zstandard.ZstdCompressor(level=STATE_ZSTD_LEVEL)
+    return [(field_name, compressor.compress(orjson.dumps(field_value))) for field_name, field_value in state_payload.items()]
+
+def parse_state_payload(state_data: Union[str, bytes]) -> Dict[str, Any]:
+    # Rows written before compression was introduced are plain JSON TEXT.
+    if isinstance(state_data, bytes):
+        state_dict = orjson.loads(zstandard.ZstdDecompressor().decompress(state_data))
+    else:
+        state_dict = json.loads(state_data)
+    if state_dict.pop(COMPETITOR_DATA_ALIAS_KEY, False):
+        state_dict["competitor_data"] = state_dict.get("raw_news_data", [])
+    return state_dict
+
+def assemble_state_json(field_rows: List[Tuple[str, bytes]]) -> bytes:
+    # Each field row already holds JSON; splice them into one document so pydantic parses and validates in a single pass.
+    decompressor = zstandard.ZstdDecompressor()
+    field_json = {field_name: decompressor.decompress(field_data) for field_name, field_data in field_rows}
+    if field_json.get("competitor_data") == COMPETITOR_DATA_ALIAS_JSON:
+        field_json["competitor_data"] = field_json.get("raw_news_data", b"[]")
+    return b"{" + b",".join(orjson.dumps(field_name) + b":" + field_value for field_name, field_value in field_json.items()) + b"}"
+
+# changed_fields=None persists every field; nodes pass the keys of the delta they return,
+# so the large news payload written by the collector is not re-serialized by every later node.
+def save_state(state_obj: MarketIntelligenceState, changed_fields: Optional[Iterable[str]] = None):
     db_path = get_db_path()
+    field_names = MarketIntelligenceState.model_fields.keys() if changed_fields is None else changed_fields
     try:
-        conn = sqlite3.connect(db_path)
-        cursor_obj = conn.cursor()
-        cursor_obj.execute(
-            'INSERT OR REPLACE INTO states (id, market_domain, query, state_data, created_at) VALUES (?, ?, ?, ?, ?)',
-            (state_obj.state_id, state_obj.market_domain, state_obj.query, state_obj.model_dump_json(), datetime.now())
-        )
-        conn.commit()
-        conn.close()
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                'INSERT INTO states (id, market_domain, query) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET market_domain = excluded.market_domain, query = excluded.query',
+                (state_obj.state_id, state_obj.market_domain, state_obj.query)
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO state_fields (state_id, field_name, field_data) VALUES (?, ?, ?)',
+                [(state_obj.state_id, field_name, field_data) for field_name, field_data in encode_state_fields(state_obj, field_names)]
+            )
+            # Page bodies referenced by this state are exempt from page_contents pruning
+            referenced_content_ids = set()
+            for field_name in set(field_names).intersection(STATE_PAGE_REF_FIELDS):
+                referenced_content_ids |= state_page_content_ids(getattr(state_obj, field_name) or [])
+            conn.executemany(
+                'INSERT OR IGNORE INTO state_page_refs (content_id, state_id) VALUES (?, ?)',
+                [(content_id, state_obj.state_id) for content_id in referenced_content_ids]
+            )
         logger.info(f"State saved: ID={state_obj.state_id}, Domain='{state_obj.market_domain}' to {db_path}")
     except Exception as e_save_state:
         error_logger.error(f"Failed to save state {state_obj.state_id} to {db_path}: {e_save_state}")
@@ -177,57 +598,305 @@ def save_state(state_obj: MarketIntelligenceState):
 def load_state(state_id_to_load: str) -> Optional[MarketIntelligenceState]:
     db_path = get_db_path()
     try:
-        conn = sqlite3.connect(db_path)
-        cursor_obj = conn.cursor()
-        cursor_obj.execute('SELECT state_data FROM states WHERE id = ?', (state_id_to_load,))
-        result_data_row = cursor_obj.fetchone()
-        conn.close()
-        if result_data_row:
-            loaded_state = MarketIntelligenceState(**json.loads(result_data_row[0]))
-            logger.info(f"State loaded: ID={state_id_to_load}, Domain='{loaded_state.market_domain}' from {db_path}")
-            return loaded_state
+        conn = _get_conn()
+        field_rows = conn.execute('SELECT field_name, field_data FROM state_fields WHERE state_id = ?', (state_id_to_load,)).fetchall()
+        if field_rows:
+            loaded_state = MarketIntelligenceState.model_validate_json(assemble_state_json(field_rows))
         else:
-            logger.warning(f"State ID '{state_id_to_load}' not found in database at {db_path}.")
-            return None
+            # States saved before per-field persistence keep the whole payload in states.state_data.
+            result_data_row = conn.execute('SELECT state_data FROM states WHERE id = ?', (state_id_to_load,)).fetchone()
+            if not result_data_row or result_data_row[0] is None:
+                logger.warning(f"State ID '{state_id_to_load}' not found in database at {db_path}.")
+                return None
+            loaded_state = MarketIntelligenceState.model_validate(parse_state_payload(result_data_row[0]))
+        logger.info(f"State loaded: ID={state_id_to_load}, Domain='{loaded_state.market_domain}' from {db_path}")
+        return loaded_state
     except Exception as e_load_state:
         error_logger.error(f"Failed to load state {state_id_to_load} from {db_path}: {e_load_state}")
         return None
 
-def save_chat_message(session_id_val: str, message_type_val: str, content_val: str):
-    db_path = get_db_path()
+def save_analysis_job(job_id_val: str, status_val: str, result_val: Optional[Dict[str, Any]] = None):
     try:
-        conn = sqlite3.connect(db_path)
-        cursor_obj = conn.cursor()
-        cursor_obj.execute(
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                'INSERT INTO analysis_jobs (job_id, status, result_data, owner_pid) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, result_data = excluded.result_data, owner_pid = excluded.owner_pid, updated_at = CURRENT_TIMESTAMP',
+                (job_id_val, status_val, orjson.dumps(result_val) if result_val is not None else None, os.getpid())
+            )
+    except Exception as e_save_job:
+        error_logger.error(f"Failed to save analysis job {job_id_val} (status={status_val}): {e_save_job}")
+
+def load_analysis_job(job_id_val: str) -> Optional[Dict[str, Any]]:
+    try:
+        job_row = _get_conn().execute('SELECT status, result_data FROM analysis_jobs WHERE job_id = ?', (job_id_val,)).fetchone()
+        if not job_row:
+            return None
+        return {"job_id": job_id_val, "status": job_row[0], "result": orjson.loads(job_row[1]) if job_row[1] is not None else None}
+    except Exception as e_load_job:
+        error_logger.error(f"Failed to load analysis job {job_id_val}: {e_load_job}")
+        return None
+
+# Chat rows are buffered and committed by a background flusher, so concurrent exchanges share one transaction.
+# A flush holds _chat_flush_lock until its commit finishes, and load_chat_history reads under the same lock, so a
+# session always sees its own latest exchange: either committed, or still waiting in the buffer after a failed flush.
+# Failed rows are retried with backoff and dropped after CHAT_FLUSH_MAX_ATTEMPTS; constraint violations are never retried.
+CHAT_FLUSH_INTERVAL_SECONDS = 0.05
+CHAT_FLUSH_MAX_ROWS = 200
+CHAT_FLUSH_MAX_ATTEMPTS = 5
+CHAT_FLUSH_MAX_BACKOFF_SECONDS = 5.0
+_chat_write_buffer: List[Tuple[str, str, str, str]] = []
+_chat_write_lock = threading.Lock()
+_chat_flush_lock = threading.RLock()
+_chat_flush_wakeup = threading.Event()
+_chat_flusher_thread: Optional[threading.Thread] = None
+# Failed flush attempts per buffered row, keyed by (session_id, timestamp)
+_chat_row_attempts: Dict[Tuple[str, str], int] = {}
+
+def _insert_chat_rows(conn: sqlite3.Connection, rows_to_insert: List[Tuple[str, str, str, str]]):
+    with conn:
+        conn.executemany(
             'INSERT INTO chat_history (session_id, message_type, content, timestamp) VALUES (?, ?, ?, ?)',
-            (session_id_val, message_type_val, content_val, datetime.now())
+            rows_to_insert
         )
-        conn.commit()
-        conn.close()
-        logger.info(f"Chat message saved: SessionID='{session_id_val}', Type='{message_type_val}' to {db_path}")
-    except Exception as e_save_chat:
-        error_logger.error(f"Failed to save chat message for SessionID '{session_id_val}' to {db_path}: {e_save_chat}")
+
+def _insert_chat_rows_per_session(conn: sqlite3.Connection, rows_to_insert: List[Tuple[str, str, str, str]]) -> List[Tuple[str, str, str, str]]:
+    # One bad session must not cost the others their rows; returns the rows worth retrying
+    rows_by_session: Dict[str, List[Tuple[str, str, str, str]]] = {}
+    for chat_row in rows_to_insert:
+        rows_by_session.setdefault(chat_row[0], []).append(chat_row)
+    retry_rows = []
+    for session_id_val, session_rows in rows_by_session.items():
+        try:
+            _insert_chat_rows(conn, session_rows)
+        except sqlite3.IntegrityError:
+            # A constraint violation fails the same way on every retry; keep the rows that do insert, drop the rest
+            for chat_row in session_rows:
+                try:
+                    _insert_chat_rows(conn, [chat_row])
+                except sqlite3.IntegrityError as e_chat_row:
+                    error_logger.error(f"Dropping chat message for SessionID '{session_id_val}' at {chat_row[3]}: {e_chat_row}")
+                except Exception:
+                    retry_rows.append(chat_row)
+        except Exception as e_save_session:
+            error_logger.error(f"Failed to flush {len(session_rows)} chat messages for SessionID '{session_id_val}': {e_save_session}")
+            retry_rows.extend(session_rows)
+    return retry_rows
+
+def flush_chat_messages() -> bool:
+    # Returns False when rows had to be put back for another attempt
+    with _chat_flush_lock:
+        with _chat_write_lock:
+            rows_to_insert = _chat_write_buffer[:]
+            _chat_write_buffer.clear()
+        if not rows_to_insert:
+            return True
+        db_path = get_db_path()
+        try:
+            conn = _get_conn()
+            try:
+                _insert_chat_rows(conn, rows_to_insert)
+                retry_rows = []
+                logger.info(f"Chat messages flushed: Count={len(rows_to_insert)} to {db_path}")
+            except Exception as e_save_chat:
+                error_logger.error(f"Failed to flush {len(rows_to_insert)} chat messages to {db_path}; retrying per session: {e_save_chat}")
+                retry_rows = _insert_chat_rows_per_session(conn, rows_to_insert)
+        except Exception as e_chat_conn:
+            error_logger.error(f"Failed to open {db_path} to flush {len(rows_to_insert)} chat messages: {e_chat_conn}")
+            retry_rows = rows_to_insert
+        retry_keys = {(chat_row[0], chat_row[3]) for chat_row in retry_rows}
+        for chat_row in rows_to_insert:
+            if (chat_row[0], chat_row[3]) not in retry_keys:
+                _chat_row_attempts.pop((chat_row[0], chat_row[3]), None)
+        requeue_rows, dropped_rows = [], 0
+        for chat_row in retry_rows:
+            row_key = (chat_row[0], chat_row[3])
+            row_attempts = _chat_row_attempts.get(row_key, 0) + 1
+            if row_attempts >= CHAT_FLUSH_MAX_ATTEMPTS:
+                _chat_row_attempts.pop(row_key, None)
+                dropped_rows += 1
+            else:
+                _chat_row_attempts[row_key] = row_attempts
+                requeue_rows.append(chat_row)
+        if dropped_rows:
+            error_logger.error(f"Dropped {dropped_rows} chat messages after {CHAT_FLUSH_MAX_ATTEMPTS} failed flush attempts.")
+        if requeue_rows:
+            # Back at the front, ahead of anything queued meanwhile, so the next flush keeps the original order
+            with _chat_write_lock:
+                _chat_write_buffer[:0] = requeue_rows
+        return not retry_rows
+
+def _chat_flusher_loop():
+    retry_delay = CHAT_FLUSH_INTERVAL_SECONDS
+    while True:
+        if retry_delay > CHAT_FLUSH_INTERVAL_SECONDS:
+            # Backing off after a failed flush; a full buffer does not cut the wait short
+            time.sleep(retry_delay)
+        else:
+            _chat_flush_wakeup.wait(CHAT_FLUSH_INTERVAL_SECONDS)
+        _chat_flush_wakeup.clear()
+        if flush_chat_messages():
+            retry_delay = CHAT_FLUSH_INTERVAL_SECONDS
+        else:
+            retry_delay = min(retry_delay * 2, CHAT_FLUSH_MAX_BACKOFF_SECONDS)
+
+atexit.register(flush_chat_messages)
+
+def save_chat_messages(session_id_val: str, messages_val: List[Tuple[str, str]]):
+    global _chat_flusher_thread
+    # CURRENT_TIMESTAMP only has second resolution, so chat rows carry their own microsecond timestamps:
+    # each row is offset by a microsecond so the batch keeps its order and the (session_id, timestamp) key stays unique.
+    batch_ts = datetime.now()
+    rows_to_insert = [
+        (session_id_val, message_type_val, content_val, (batch_ts + timedelta(microseconds=idx)).isoformat(" ", timespec="microseconds"))
+        for idx, (message_type_val, content_val) in enumerate(messages_val)
+    ]
+    with _chat_write_lock:
+        _chat_write_buffer.extend(rows_to_insert)
+        buffered_rows = len(_chat_write_buffer)
+        if _chat_flusher_thread is None:
+            _chat_flusher_thread = threading.Thread(target=_chat_flusher_loop, name="chat-flusher", daemon=True)
+            _chat_flusher_thread.start()
+    if buffered_rows >= CHAT_FLUSH_MAX_ROWS:
+        _chat_flush_wakeup.set()
+    logger.info(f"Chat messages queued: SessionID='{session_id_val}', Count={len(rows_to_insert)}")
+
+def save_chat_message(session_id_val: str, message_type_val: str, content_val: str):
+    save_chat_messages(session_id_val, [(message_type_val, content_val)])
 
 def load_chat_history(session_id_val: str) -> List[Dict[str, Any]]:
     db_path = get_db_path()
+    with _chat_flush_lock:
+        flush_chat_messages()
+        try:
+            conn = _get_conn()
+            history_rows = conn.execute('SELECT message_type, content FROM chat_history WHERE session_id = ? ORDER BY timestamp ASC', (session_id_val,)).fetchall()
+        except Exception as e_load_chat:
+            error_logger.error(f"Failed to load chat history for SessionID '{session_id_val}' from {db_path}: {e_load_chat}")
+            return []
+        # Rows a failed flush left in the buffer are newer than anything committed for this session
+        with _chat_write_lock:
+            history_rows.extend((chat_row[1], chat_row[2]) for chat_row in _chat_write_buffer if chat_row[0] == session_id_val)
+    messages_history_list = [{"type": row[0], "content": row[1]} for row in history_rows]
+    logger.info(f"Chat history loaded: SessionID='{session_id_val}', Messages Count={len(messages_history_list)} from {db_path}")
+    return messages_history_list
+
+def load_cached_page(url_val: str) -> Optional[Dict[str, Any]]:
     try:
-        conn = sqlite3.connect(db_path)
-        cursor_obj = conn.cursor()
-        cursor_obj.execute('SELECT message_type, content FROM chat_history WHERE session_id = ? ORDER BY timestamp ASC', (session_id_val,))
-        messages_history_list = [{"type": row[0], "content": row[1]} for row in cursor_obj.fetchall()]
-        conn.close()
-        logger.info(f"Chat history loaded: SessionID='{session_id_val}', Messages Count={len(messages_history_list)} from {db_path}")
-        return messages_history_list
-    except Exception as e_load_chat:
-        error_logger.error(f"Failed to load chat history for SessionID '{session_id_val}' from {db_path}: {e_load_chat}")
-        return []
+        cached_row = _get_conn().execute('SELECT etag, last_modified, page_data FROM page_cache WHERE url = ?', (url_val,)).fetchone()
+        if not cached_row:
+            return None
+        page_data = orjson.loads(cached_row[2])
+        if page_data.get("content_id"):
+            page_data = resolve_page_contents([page_data])[0]
+            if not page_data["full_content"]:
+                # The body was pruned; without it a 304 would be useless, so fetch the page unconditionally
+                return None
+        return {"etag": cached_row[0], "last_modified": cached_row[1], "page_data": page_data}
+    except Exception as e_load_page:
+        error_logger.error(f"Failed to load cached page for URL '{url_val}': {e_load_page}")
+        return None
+
+def save_cached_page(url_val: str, etag_val: Optional[str], last_modified_val: Optional[str], page_data_val: Dict[str, Any]):
+    # The body goes to page_contents like any other fetched page; the page_cache row keeps only its content_id
+    page_data_val = store_page_contents([page_data_val])[0]
+    try:
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO page_cache (url, etag, last_modified, page_data) VALUES (?, ?, ?, ?)',
+                (url_val, etag_val, last_modified_val, orjson.dumps(page_data_val).decode())
+            )
+    except Exception as e_save_page:
+        error_logger.error(f"Failed to cache page for URL '{url_val}': {e_save_page}")
+
+# Keeps each IN (...) lookup under SQLite's bound-parameter limit on older builds
+EMBEDDING_CACHE_LOOKUP_BATCH = 500
+
+# Page bodies live in the content-addressed page_contents table; state items carry only a content_id
+# in place of full_content, so checkpoints and persisted state stay small.
+def store_page_contents(data_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    compressor = zstandard.ZstdCompressor(level=STATE_ZSTD_LEVEL)
+    content_rows, referenced_items = {}, []
+    for data_item in data_items:
+        body_text = data_item.get("full_content")
+        if not body_text:
+            referenced_items.append(data_item)
+            continue
+        body_bytes = body_text.encode("utf-8")
+        content_id = hashlib.blake2b(body_bytes, digest_size=16).hexdigest()
+        content_rows.setdefault(content_id, compressor.compress(body_bytes))
+        referenced_item = {k: v for k, v in data_item.items() if k != "full_content"}
+        referenced_item["content_id"] = content_id
+        referenced_items.append(referenced_item)
+    stored_at_ts = time.time()
+    try:
+        conn = _get_conn()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO page_contents (content_id, body, stored_at) VALUES (?, ?, ?)', [(content_id, body_blob, stored_at_ts) for content_id, body_blob in content_rows.items()])
+            # Bodies that were already stored are referenced again, so they restart their TTL
+            conn.executemany('UPDATE page_contents SET stored_at = ? WHERE content_id = ?', [(stored_at_ts, content_id) for content_id in content_rows])
+        return referenced_items
+    except Exception as e_store_contents:
+        error_logger.error(f"Failed to store {len(content_rows)} page bodies; keeping them inline in state: {e_store_contents}")
+        return data_items
+
+def resolve_page_contents(data_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    content_ids = list({data_item["content_id"] for data_item in data_items if data_item.get("content_id")})
+    if not content_ids:
+        return data_items
+    page_bodies = {}
+    try:
+        conn = _get_conn()
+        decompressor = zstandard.ZstdDecompressor()
+        for batch_start in range(0, len(content_ids), EMBEDDING_CACHE_LOOKUP_BATCH):
+            batch_ids = content_ids[batch_start:batch_start + EMBEDDING_CACHE_LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch_ids))
+            for content_id, body_blob in conn.execute(f'SELECT content_id, body FROM page_contents WHERE content_id IN ({placeholders})', batch_ids):
+                page_bodies[content_id] = decompressor.decompress(body_blob).decode("utf-8")
+    except Exception as e_load_contents:
+        error_logger.error(f"Failed to load {len(content_ids)} page bodies: {e_load_contents}")
+    resolved_items = []
+    for data_item in data_items:
+        content_id = data_item.get("content_id")
+        if content_id:
+            data_item = {k: v for k, v in data_item.items() if k != "content_id"}
+            data_item["full_content"] = page_bodies.get(content_id, "")
+        resolved_items.append(data_item)
+    return resolved_items
+
+def load_cached_embeddings(content_hashes: List[str]) -> Dict[str, np.ndarray]:
+    cached_vectors = {}
+    try:
+        conn = _get_conn()
+        for batch_start in range(0, len(content_hashes), EMBEDDING_CACHE_LOOKUP_BATCH):
+            hash_batch = content_hashes[batch_start:batch_start + EMBEDDING_CACHE_LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(hash_batch))
+            for content_hash, vector_blob in conn.execute(f'SELECT content_hash, vector FROM embedding_cache WHERE content_hash IN ({placeholders})', hash_batch):
+                cached_vectors[content_hash] = np.frombuffer(vector_blob, dtype=np.float32)
+    except Exception as e_load_emb:
+        error_logger.error(f"Failed to load cached embeddings: {e_load_emb}")
+    return cached_vectors
+
+def save_cached_embeddings(hash_vector_pairs: List[Tuple[str, np.ndarray]]):
+    stored_at_ts = time.time()
+    try:
+        conn = _get_conn()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (content_hash, vector, stored_at) VALUES (?, ?, ?)',
+                [(content_hash, vector_val.tobytes(), stored_at_ts) for content_hash, vector_val in hash_vector_pairs]
+            )
+    except Exception as e_save_emb:
+        error_logger.error(f"Failed to cache {len(hash_vector_pairs)} embeddings: {e_save_emb}")
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=8))
 def search_with_tavily(search_query: str) -> List[str]:
-    normalized_cache_key = f"tavily_search_{search_query.lower().replace(' ', '_')}"
-    if normalized_cache_key in search_results_cache:
+    normalized_cache_key = _cache_key(search_query)
+    cached_result = cache_get(tavily_search_cache, normalized_cache_key)
+    if cached_result is not None:
         logger.info(f"Tavily Search: Cache hit for query: '{search_query}'")
-        return search_results_cache[normalized_cache_key]
+        return cached_result
 
     tavily_api_key_val = get_api_key("TAVILY")
     if not tavily_api_key_val:
@@ -236,7 +905,7 @@ def search_with_tavily(search_query: str) -> List[str]:
 
     try:
         logger.info(f"Tavily Search: Performing API search for query: '{search_query}'")
-        response = requests.post(
+        response = provider_http_session.post(
             "https://api.tavily.com/search",
             headers={"Content-Type": "application/json", "Accept": "application/json"},
             json={
@@ -247,7 +916,7 @@ def search_with_tavily(search_query: str) -> List[str]:
         response.raise_for_status()
         response_data = response.json()
         extracted_urls = [r["url"] for r in response_data.get("results", []) if r.get("url")]
-        search_results_cache[normalized_cache_key] = extracted_urls
+        cache_put(tavily_search_cache, normalized_cache_key, extracted_urls)
         logger.info(f"Tavily Search: Retrieved {len(extracted_urls)} URLs for query: '{search_query}'")
         return extracted_urls
     except requests.exceptions.RequestException as e_tavily_req:
@@ -263,10 +932,11 @@ def search_with_serpapi(search_query: str) -> List[str]:
         logger.warning("SerpAPI search called but library not available.")
         return []
 
-    normalized_cache_key = f"serpapi_search_{search_query.lower().replace(' ', '_')}"
-    if normalized_cache_key in search_results_cache:
+    normalized_cache_key = _cache_key(search_query)
+    cached_result = cache_get(serpapi_search_cache, normalized_cache_key)
+    if cached_result is not None:
         logger.info(f"SerpAPI Search: Cache hit for query: '{search_query}'")
-        return search_results_cache[normalized_cache_key]
+        return cached_result
 
     api_key = get_api_key("SERPAPI")
     if not api_key:
@@ -285,7 +955,7 @@ def search_with_serpapi(search_query: str) -> List[str]:
         search = SerpApiClient(params)
         results = search.get_dict()
         extracted_urls = [r["link"] for r in results.get("organic_results", []) if "link" in r]
-        search_results_cache[normalized_cache_key] = extracted_urls
+        cache_put(serpapi_search_cache, normalized_cache_key, extracted_urls)
         logger.info(f"SerpAPI Search: Retrieved {len(extracted_urls)} URLs for query: '{search_query}'")
         return extracted_urls
     except requests.exceptions.RequestException as e_serpapi_req:
@@ -301,10 +971,11 @@ def fetch_from_newsapi_direct(query: str) -> List[Dict[str, Any]]:
         logger.warning("NewsAPI search called but library not available.")
         return []
 
-    cache_key = f"newsapi_direct_search_{query.lower().replace(' ', '_')}"
-    if cache_key in search_results_cache:
+    cache_key = _cache_key(query)
+    cached_result = cache_get(newsapi_search_cache, cache_key)
+    if cached_result is not None:
         logger.info(f"NewsAPI Direct: Cache hit for query: '{query}'")
-        return search_results_cache[cache_key]
+        return cached_result
 
     api_key = get_api_key("NEWS_API")
     if not api_key:
@@ -325,7 +996,7 @@ def fetch_from_newsapi_direct(query: str) -> List[Dict[str, Any]]:
                 "url": article.get('url'),
                 "publishedAt": article.get('publishedAt')
             })
-        search_results_cache[cache_key] = transformed_articles
+        cache_put(newsapi_search_cache, cache_key, transformed_articles)
         logger.info(f"NewsAPI Direct: Retrieved {len(transformed_articles)} articles for query: '{query}'")
         return transformed_articles
     except Exception as e_newsapi:
@@ -334,10 +1005,11 @@ def fetch_from_newsapi_direct(query: str) -> List[Dict[str, Any]]:
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=8))
 def fetch_from_mediastack_direct(query: str) -> List[Dict[str, Any]]:
-    cache_key = f"mediastack_direct_search_{query.lower().replace(' ', '_')}"
-    if cache_key in search_results_cache:
+    cache_key = _cache_key(query)
+    cached_result = cache_get(mediastack_search_cache, cache_key)
+    if cached_result is not None:
         logger.info(f"MediaStack Direct: Cache hit for query: '{query}'")
-        return search_results_cache[cache_key]
+        return cached_result
 
     api_key = get_api_key("MEDIASTACK")
     if not api_key:
@@ -350,7 +1022,7 @@ def fetch_from_mediastack_direct(query: str) -> List[Dict[str, Any]]:
 
     try:
         logger.info(f"MediaStack Direct: Performing API search for query: '{query}'")
-        response = requests.get(endpoint, params=params)
+        response = provider_http_session.get(endpoint, params=params)
         response.raise_for_status()
         data = response.json()
         for article in data.get('data', []):
@@ -362,7 +1034,7 @@ def fetch_from_mediastack_direct(query: str) -> List[Dict[str, Any]]:
                 "url": article.get('url'),
                 "publishedAt": article.get('published_at')
             })
-        search_results_cache[cache_key] = transformed_articles
+        cache_put(mediastack_search_cache, cache_key, transformed_articles)
         logger.info(f"MediaStack Direct: Retrieved {len(transformed_articles)} articles for query: '{query}'")
         return transformed_articles
     except requests.exceptions.RequestException as e_mediastack_req:
@@ -378,17 +1050,18 @@ def fetch_financial_data_fmp(query: str) -> List[Dict[str, Any]]:
         logger.warning("FMP SDK called but library not available.")
         return []
 
-    cache_key = f"fmp_data_{query.lower().replace(' ', '_')}"
-    if cache_key in search_results_cache:
+    cache_key = _cache_key(query)
+    cached_result = cache_get(fmp_data_cache, cache_key)
+    if cached_result is not None:
         logger.info(f"FMP: Cache hit for query: '{query}'")
-        return search_results_cache[cache_key]
+        return cached_result
 
     api_key = get_api_key("FINANCIAL_MODELING_PREP")
     if not api_key:
         logger.warning("FMP_API_KEY not found or not set. Skipping FMP data fetch.")
         return []
 
-    potential_symbols = re.findall(r'\b([A-Z]{1,5})\b', query)
+    potential_symbols = _SYMBOL_RE.findall(query)
     symbol_to_use = potential_symbols[0] if potential_symbols else None
     if not symbol_to_use:
         logger.warning(f"No valid stock symbol found in query '{query}'. Skipping FMP data fetch.")
@@ -414,7 +1087,7 @@ def fetch_financial_data_fmp(query: str) -> List[Dict[str, Any]]:
                 "data": quote[0] if isinstance(quote, list) else quote
             })
         logger.info(f"FMP: Fetched {len(fetched_fmp_data)} data points for symbol {symbol_to_use}.")
-        search_results_cache[cache_key] = fetched_fmp_data
+        cache_put(fmp_data_cache, cache_key, fetched_fmp_data)
         return fetched_fmp_data
     except Exception as e:
         error_logger.error(f"FMP data fetching failed for symbol {symbol_to_use}: {e}\n{traceback.format_exc()}")
@@ -426,17 +1099,18 @@ def fetch_financial_data_alphavantage(query: str) -> List[Dict[str, Any]]:
         logger.warning("Alpha Vantage library called but not fully available.")
         return []
 
-    cache_key = f"alphavantage_data_{query.lower().replace(' ', '_')}"
-    if cache_key in search_results_cache:
+    cache_key = _cache_key(query)
+    cached_result = cache_get(alphavantage_data_cache, cache_key)
+    if cached_result is not None:
         logger.info(f"AlphaVantage: Cache hit for query: '{query}'")
-        return search_results_cache[cache_key]
+        return cached_result
 
     api_key = get_api_key("ALPHA_VANTAGE")
     if not api_key:
         logger.warning("ALPHA_VANTAGE_API_KEY not found or not set. Skipping Alpha Vantage data fetch.")
         return []
 
-    potential_symbols = re.findall(r'\b([A-Z]{1,5})\b', query)
+    potential_symbols = _SYMBOL_RE.findall(query)
     symbol_to_use = potential_symbols[0] if potential_symbols else None
     if not symbol_to_use:
         logger.warning(f"No valid stock symbol found in query '{query}'. Skipping Alpha Vantage data fetch.")
@@ -448,7 +1122,7 @@ def fetch_financial_data_alphavantage(query: str) -> List[Dict[str, Any]]:
             ts = TimeSeries(key=api_key, output_format='json')
             data_ts, meta_data_ts = ts.get_daily(symbol=symbol_to_use, outputsize='compact')
             if data_ts:
-                latest_date = sorted(data_ts.keys(), reverse=True)[0]
+                latest_date = max(data_ts)
                 latest_data_point = data_ts[latest_date]
                 fetched_av_data.append({
                     "source": "AlphaVantage",
@@ -472,35 +1146,131 @@ def fetch_financial_data_alphavantage(query: str) -> List[Dict[str, Any]]:
                 logger.warning(f"AlphaVantage: Could not fetch company overview for {symbol_to_use}: {e_overview}")
 
         logger.info(f"AlphaVantage: Fetched {len(fetched_av_data)} data points for symbol {symbol_to_use}.")
-        search_results_cache[cache_key] = fetched_av_data
+        cache_put(alphavantage_data_cache, cache_key, fetched_av_data)
         return fetched_av_data
     except Exception as e:
         error_logger.error(f"AlphaVantage data fetching failed for symbol {symbol_to_use}: {e}\n{traceback.format_exc()}")
         return []
 
-async def fetch_url_content(url_to_fetch: str) -> Dict[str, Any]:
+# Script/style bodies and page chrome are not article text; dropped before extraction
+PAGE_NOISE_TAGS = ("script", "style", "noscript", "nav", "footer", "header")
+PAGE_NOISE_XPATH = " | ".join(f"//{tag_name}" for tag_name in PAGE_NOISE_TAGS)
+
+def parse_page_html(page_html: str) -> Tuple[str, str]:
+    if not page_html.strip():
+        return "", ""
+    if lxml_html is not None:
+        try:
+            page_tree = lxml_html.fromstring(page_html)
+        except (ValueError, lxml_etree.ParserError):
+            # lxml refuses str input that carries an XML encoding declaration, and bodies with no elements (e.g. only
+            # a comment) raise "Document is empty"; BeautifulSoup handles both below
+            page_tree = None
+        if page_tree is not None:
+            for noise_element in page_tree.xpath(PAGE_NOISE_XPATH):
+                if noise_element.getparent() is not None:
+                    noise_element.drop_tree()
+            return page_tree.text_content(), (page_tree.findtext(".//title") or "").strip()
+    page_soup = BeautifulSoup(page_html, "html.parser")
+    for noise_tag in page_soup(PAGE_NOISE_TAGS):
+        noise_tag.decompose()
+    title_tag = page_soup.find("title")
+    return page_soup.get_text(), (title_tag.get_text().strip() if title_tag else "")
+
+# One pooled HTTP/2 client per event loop, so runs reuse its connections and TLS context instead of building a new one
+_shared_http_client: Optional[httpx.AsyncClient] = None
+_shared_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _shared_http_client, _shared_http_client_loop
+    running_loop = asyncio.get_running_loop()
+    if _shared_http_client is None or _shared_http_client.is_closed or _shared_http_client_loop is not running_loop:
+        _shared_http_client = httpx.AsyncClient(http2=True, headers={"User-Agent": os.environ["USER_AGENT"]})
+        _shared_http_client_loop = running_loop
+    return _shared_http_client
+
+async def close_http_client():
+    global _shared_http_client, _shared_http_client_loop
+    if _shared_http_client is not None and _shared_http_client_loop is asyncio.get_running_loop():
+        await _shared_http_client.aclose()
+    _shared_http_client = None
+    _shared_http_client_loop = None
+
+async def fetch_url_content(http_client: httpx.AsyncClient, url_to_fetch: str) -> Dict[str, Any]:
+    cached_page_data = cache_get(url_content_cache, url_to_fetch)
+    if cached_page_data is not None:
+        logger.info(f"URL Fetch: Cache hit for URL: {url_to_fetch}")
+        return cached_page_data
     try:
-        logger.info(f"WebBaseLoader: Loading content from URL: {url_to_fetch}")
-        loader = WebBaseLoader([url_to_fetch])
-        loaded_docs = await loader.aload() # Use aload for async
-        doc_object = loaded_docs[0] if loaded_docs else None
-
-        if doc_object:
-            raw_page_content = doc_object.page_content
-            cleaned_page_content = re.sub(r'\n\s*\n', '\n\n', raw_page_content).strip()
+        cached_page = await asyncio.to_thread(load_cached_page, url_to_fetch)
+        conditional_headers = {}
+        if cached_page:
+            if cached_page["etag"]:
+                conditional_headers["If-None-Match"] = cached_page["etag"]
+            if cached_page["last_modified"]:
+                conditional_headers["If-Modified-Since"] = cached_page["last_modified"]
+
+        logger.info(f"URL Fetch: Loading content from URL: {url_to_fetch}")
+        response = await http_client.get(url_to_fetch, headers=conditional_headers, timeout=15, follow_redirects=True)
+        if response.status_code == 304 and cached_page:
+            logger.info(f"URL Fetch: {url_to_fetch} not modified, using cached content.")
+            cache_put(url_content_cache, url_to_fetch, cached_page["page_data"])
+            return cached_page["page_data"]
+        response.raise_for_status()
+        # html.parser is pure Python; parsing off the event loop lets other fetches keep streaming meanwhile
+        raw_page_content, page_title = await asyncio.to_thread(parse_page_html, response.text)
+
+        if raw_page_content:
+            cleaned_page_content = _BLANKS_RE.sub('\n\n', raw_page_content).strip()
             summary_text = cleaned_page_content[:1000]
-            document_title = doc_object.metadata.get("title", "") or os.path.basename(url_to_fetch)
+            document_title = page_title or os.path.basename(url_to_fetch)
             if not document_title:
                 document_title = "Untitled Document"
-            logger.info(f"WebBaseLoader: Loaded from {url_to_fetch}. Title: '{document_title}'. Summary (first 50): '{summary_text[:50]}...'")
-            return {"source": url_to_fetch, "title": document_title, "summary": summary_text, "full_content": cleaned_page_content, "url": url_to_fetch}
+            logger.info(f"URL Fetch: Loaded from {url_to_fetch}. Title: '{document_title}'. Summary (first 50): '{summary_text[:50]}...'")
+            page_data = {"source": url_to_fetch, "title": document_title, "summary": summary_text, "full_content": cleaned_page_content, "url": url_to_fetch}
+            etag_header = response.headers.get("ETag")
+            last_modified_header = response.headers.get("Last-Modified")
+            if etag_header or last_modified_header:
+                await asyncio.to_thread(save_cached_page, url_to_fetch, etag_header, last_modified_header, page_data)
+            cache_put(url_content_cache, url_to_fetch, page_data)
+            return page_data
         else:
-            logger.warning(f"WebBaseLoader: No document object returned from {url_to_fetch}")
+            logger.warning(f"URL Fetch: No content returned from {url_to_fetch}")
             return {"source": url_to_fetch, "title": "Content Not Loaded", "summary": "", "full_content": "", "url": url_to_fetch}
     except Exception as e_fetch_url:
-        error_logger.error(f"WebBaseLoader: Failed to load content from URL '{url_to_fetch}': {e_fetch_url}\n{traceback.format_exc()}")
+        error_logger.error(f"URL Fetch: Failed to load content from URL '{url_to_fetch}': {e_fetch_url}\n{traceback.format_exc()}")
         return {"source": url_to_fetch, "title": f"Failed to Load: {os.path.basename(url_to_fetch)}", "summary": str(e_fetch_url), "full_content": "", "url": url_to_fetch}
 
+async def fetch_urls_content(urls_to_fetch: List[str]) -> List[Dict[str, Any]]:
+    fetch_semaphore = asyncio.Semaphore(URL_FETCH_CONCURRENCY)
+
+    async def bounded_fetch(http_client: httpx.AsyncClient, url_to_fetch: str) -> Dict[str, Any]:
+        async with fetch_semaphore:
+            try:
+                return await asyncio.wait_for(fetch_url_content(http_client, url_to_fetch), timeout=URL_FETCH_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                error_logger.error(f"URL Fetch: Gave up on '{url_to_fetch}' after {URL_FETCH_TIMEOUT_SECONDS}s.")
+                return {"source": url_to_fetch, "title": f"Failed to Load: {os.path.basename(url_to_fetch)}", "summary": "Timed out", "full_content": "", "url": url_to_fetch}
+
+    http_client = get_http_client()
+    return await asyncio.gather(*[bounded_fetch(http_client, u) for u in urls_to_fetch])
+
+# Directories this process has already created; skips the stat/mkdir pair on every later call
+_created_dirs = set()
+_created_dirs_lock = threading.Lock()
+
+def ensure_dir(dir_path: str):
+    if dir_path in _created_dirs:
+        return
+    os.makedirs(dir_path, exist_ok=True)
+    with _created_dirs_lock:
+        _created_dirs.add(dir_path)
+
+def is_known_dir(dir_path: str) -> bool:
+    # Directories created through ensure_dir in this process are trusted without another stat
+    return dir_path in _created_dirs or os.path.isdir(dir_path)
+
+@functools.lru_cache(maxsize=1)
 def get_agent_base_reports_dir():
     agent_script_dir = os.path.dirname(os.path.abspath(__file__))
     base_reports_dir = os.path.join(agent_script_dir, "reports1")
@@ -509,143 +1279,143 @@ def get_agent_base_reports_dir():
         logger.info(f"Vercel environment detected. Using /tmp/reports1 for reports base.")
     else:
         logger.info(f"Local environment. Using {base_reports_dir} for reports base.")
-    os.makedirs(base_reports_dir, exist_ok=True)
+    ensure_dir(base_reports_dir)
     return base_reports_dir
 
+def run_provider_tasks(provider_tasks: Dict[str, Tuple[Any, str]]) -> Dict[str, List[Any]]:
+    provider_results = {}
+    with ThreadPoolExecutor(max_workers=PROVIDER_FETCH_WORKERS) as provider_pool:
+        futures_to_names = {provider_pool.submit(fetch_fn, fetch_arg): provider_name for provider_name, (fetch_fn, fetch_arg) in provider_tasks.items()}
+        for provider_future in as_completed(futures_to_names):
+            provider_name = futures_to_names[provider_future]
+            try:
+                provider_results[provider_name] = provider_future.result()
+                logger.info(f"{provider_name} returned {len(provider_results[provider_name])} items.")
+            except Exception as e_provider:
+                error_logger.error(f"{provider_name} failed: {e_provider}")
+                provider_results[provider_name] = []
+    return provider_results
+
+# The collector's JSON/CSV dumps are not needed until setup_vector_store, so they do not block the analysis nodes.
+DATA_FILE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="data-files")
+_pending_data_file_writes = {}
+atexit.register(DATA_FILE_EXECUTOR.shutdown, wait=True)
+
+def write_data_source_files(json_file_path: str, csv_file_path: str, all_fetched_data: List[Dict[str, Any]]):
+    try:
+        with open(json_file_path, "wb") as f:
+            f.write(orjson.dumps(all_fetched_data, option=orjson.OPT_INDENT_2))
+        logger.info(f"Market Data Collector: Data saved to JSON: {json_file_path}")
+    except Exception as e_json:
+        error_logger.error(f"Failed to save JSON '{json_file_path}': {e_json}")
+
+    try:
+        with open(csv_file_path, "w", newline="", encoding="utf-8", buffering=CSV_WRITE_BUFFER_BYTES) as f:
+            writer_csv = csv.writer(f)
+            writer_csv.writerow(DATA_SOURCE_CSV_FIELDS)
+            writer_csv.writerows(
+                tuple(data_item.get(field_name, "") for field_name in DATA_SOURCE_CSV_FIELDS)
+                for data_item in all_fetched_data
+            )
+        logger.info(f"Market Data Collector: Data saved to CSV: {csv_file_path}")
+    except Exception as e_csv:
+        error_logger.error(f"Failed to save CSV '{csv_file_path}': {e_csv}")
+
 async def market_data_collector(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Market Data Collector: Domain='{current_state.market_domain}', Query='{current_state.query or 'N/A'}'")
     ts_string = datetime.now().strftime("%Y%m%d_%H%M%S")
-    query_prefix = re.sub(r'[^a-zA-Z0-9_-]', '_', (current_state.query or "general").lower().replace(' ', '_')[:20])
+    query_prefix = _SLUG_RE.sub('_', (current_state.query or "general").lower().replace(' ', '_')[:20])
     base_reports_path = get_agent_base_reports_dir()
     run_report_dir = os.path.join(base_reports_path, f"{query_prefix}_{ts_string}")
     try:
-        os.makedirs(run_report_dir, exist_ok=True)
+        ensure_dir(run_report_dir)
         current_state.report_dir = run_report_dir
         logger.info(f"Market Data Collector: Report directory set to: {run_report_dir}")
     except Exception as e_mkdir_report:
         error_logger.critical(f"CRITICAL: Failed to create report directory '{run_report_dir}': {e_mkdir_report}")
         raise IOError(f"Cannot create report directory '{run_report_dir}': {e_mkdir_report}")
 
-    json_file_path = os.path.join(run_report_dir, f"{current_state.market_domain.lower().replace(' ', '_')}_data_sources.json")
-    csv_file_path = os.path.join(run_report_dir, f"{current_state.market_domain.lower().replace(' ', '_')}_data_sources.csv")
+    json_file_path = os.path.join(run_report_dir, current_state.data_json_basename)
+    csv_file_path = os.path.join(run_report_dir, current_state.data_csv_basename)
 
     news_search_query = f"{current_state.query} {current_state.market_domain} news trends developments emerging technologies"
     competitor_search_query = f"{current_state.query} {current_state.market_domain} competitor landscape key players market share"
-    news_urls_list = []
-    competitor_urls_list = []
-    serpapi_news_urls_list = []
-    serpapi_competitor_urls_list = []
-
-    try:
-        logger.info("Attempting Tavily search for news URLs...")
-        news_urls_list = search_with_tavily(news_search_query)
-        logger.info(f"Tavily news search returned {len(news_urls_list)} URLs.")
-    except Exception as e_tavily_news:
-        error_logger.error(f"Tavily news search failed: {e_tavily_news}")
-
-    try:
-        logger.info("Attempting Tavily search for competitor URLs...")
-        competitor_urls_list = search_with_tavily(competitor_search_query)
-        logger.info(f"Tavily competitor search returned {len(competitor_urls_list)} URLs.")
-    except Exception as e_tavily_comp:
-        error_logger.error(f"Tavily competitor search failed: {e_tavily_comp}")
+    current_query_or_domain = current_state.query if current_state.query else current_state.market_domain
 
+    provider_tasks = {
+        "Tavily news search": (search_with_tavily, news_search_query),
+        "Tavily competitor search": (search_with_tavily, competitor_search_query),
+    }
     if SerpApiClient is not None:
-        try:
-            logger.info("Attempting SerpAPI search for news URLs...")
-            serpapi_news_urls_list = search_with_serpapi(news_search_query)
-            logger.info(f"SerpAPI news search returned {len(serpapi_news_urls_list)} URLs.")
-        except Exception as e_serp_news:
-            error_logger.error(f"SerpAPI news search failed: {e_serp_news}")
-        try:
-            logger.info("Attempting SerpAPI search for competitor URLs...")
-            serpapi_competitor_urls_list = search_with_serpapi(competitor_search_query)
-            logger.info(f"SerpAPI competitor search returned {len(serpapi_competitor_urls_list)} URLs.")
-        except Exception as e_serp_comp:
-            error_logger.error(f"SerpAPI competitor search failed: {e_serp_comp}")
+        provider_tasks["SerpAPI news search"] = (search_with_serpapi, news_search_query)
+        provider_tasks["SerpAPI competitor search"] = (search_with_serpapi, competitor_search_query)
     else:
         logger.info("SerpAPI library not available, skipping SerpAPI searches.")
-
-    combined_unique_urls = list(set(news_urls_list + competitor_urls_list + serpapi_news_urls_list + serpapi_competitor_urls_list))
-    logger.info(f"Market Data Collector: Total unique URLs to process: {len(combined_unique_urls)}")
-
-    all_fetched_data = []
-    current_query_or_domain = current_state.query if current_state.query else current_state.market_domain
-
     if NewsApiClient is not None:
-        try:
-            logger.info(f"Fetching from NewsAPI for query: '{current_query_or_domain}'")
-            newsapi_articles = fetch_from_newsapi_direct(current_query_or_domain)
-            all_fetched_data.extend(newsapi_articles)
-            logger.info(f"Retrieved {len(newsapi_articles)} articles from NewsAPI.")
-        except Exception as e_newsapi:
-            error_logger.error(f"Failed to fetch from NewsAPI: {e_newsapi}")
-
-    try:
-        logger.info(f"Fetching from MediaStack for query: '{current_query_or_domain}'")
-        mediastack_articles = fetch_from_mediastack_direct(current_query_or_domain)
-        all_fetched_data.extend(mediastack_articles)
-        logger.info(f"Retrieved {len(mediastack_articles)} articles from MediaStack.")
-    except Exception as e_mstack:
-        error_logger.error(f"Failed to fetch from MediaStack: {e_mstack}")
-
-    current_state.financial_data = []
+        provider_tasks["NewsAPI"] = (fetch_from_newsapi_direct, current_query_or_domain)
+    provider_tasks["MediaStack"] = (fetch_from_mediastack_direct, current_query_or_domain)
     if fmpsdk is not None:
-        try:
-            logger.info(f"Fetching financial data from FMP for query: '{current_query_or_domain}'")
-            fmp_fin_data = fetch_financial_data_fmp(current_query_or_domain)
-            current_state.financial_data.extend(fmp_fin_data)
-            logger.info(f"Retrieved {len(fmp_fin_data)} data items from FMP.")
-        except Exception as e_fmp_fin:
-            error_logger.error(f"Failed to fetch financial data from FMP: {e_fmp_fin}")
-
+        provider_tasks["FMP"] = (fetch_financial_data_fmp, current_query_or_domain)
     if TimeSeries is not None and FundamentalData is not None:
-        try:
-            logger.info(f"Fetching financial data from Alpha Vantage for query: '{current_query_or_domain}'")
-            av_fin_data = fetch_financial_data_alphavantage(current_query_or_domain)
-            current_state.financial_data.extend(av_fin_data)
-            logger.info(f"Retrieved {len(av_fin_data)} data items from Alpha Vantage.")
-        except Exception as e_av_fin:
-            error_logger.error(f"Failed to fetch financial data from Alpha Vantage: {e_av_fin}")
+        provider_tasks["Alpha Vantage"] = (fetch_financial_data_alphavantage, current_query_or_domain)
+
+    logger.info(f"Market Data Collector: Querying {len(provider_tasks)} providers concurrently.")
+    provider_results = await asyncio.to_thread(run_provider_tasks, provider_tasks)
 
+    combined_unique_urls = list(set(
+        provider_results.get("Tavily news search", []) + provider_results.get("Tavily competitor search", []) +
+        provider_results.get("SerpAPI news search", []) + provider_results.get("SerpAPI competitor search", [])
+    ))
+    logger.info(f"Market Data Collector: Total unique URLs to process: {len(combined_unique_urls)}")
+
+    all_fetched_data = provider_results.get("NewsAPI", []) + provider_results.get("MediaStack", [])
+    current_state.financial_data = provider_results.get("FMP", []) + provider_results.get("Alpha Vantage", [])
     logger.info(f"Total financial data items collected: {len(current_state.financial_data)}")
 
-    for idx, loop_url in enumerate(combined_unique_urls):
-        if any(article.get("url") == loop_url for article in all_fetched_data):
+    fetched_urls = {article.get("url") for article in all_fetched_data if article.get("url")}
+    urls_to_fetch = []
+    for loop_url in combined_unique_urls:
+        if loop_url in fetched_urls:
             logger.info(f"Market Data Collector: Skipping URL {loop_url} as it was fetched directly.")
             continue
-        logger.info(f"Market Data Collector: Processing URL {idx + 1}/{len(combined_unique_urls)}: {loop_url}")
-        content_data = await fetch_url_content(loop_url) # Await async call
-        all_fetched_data.append(content_data)
+        urls_to_fetch.append(loop_url)
+    logger.info(f"Market Data Collector: Fetching {len(urls_to_fetch)} URLs (concurrency={URL_FETCH_CONCURRENCY}).")
+    all_fetched_data.extend(await fetch_urls_content(urls_to_fetch))
 
-    current_state.raw_news_data = all_fetched_data
-    current_state.competitor_data = all_fetched_data
+    state_news_data = await asyncio.to_thread(store_page_contents, all_fetched_data)
+    # Once per run at most hourly, in a worker thread rather than on the per-page fetch path
+    await asyncio.to_thread(maybe_prune_cache_tables)
+    current_state.raw_news_data = current_state.competitor_data = state_news_data
 
-    try:
-        with open(json_file_path, "w", encoding="utf-8") as f:
-            json.dump(all_fetched_data, f, indent=4)
-        logger.info(f"Market Data Collector: Data saved to JSON: {json_file_path}")
-    except Exception as e_json:
-        error_logger.error(f"Failed to save JSON '{json_file_path}': {e_json}")
-
-    try:
-        with open(csv_file_path, "w", newline="", encoding="utf-8") as f:
-            field_names_csv = ["title", "summary", "url", "source", "full_content"]
-            writer_csv = csv.DictWriter(f, fieldnames=field_names_csv, extrasaction='ignore')
-            writer_csv.writeheader()
-            writer_csv.writerows(all_fetched_data)
-        logger.info(f"Market Data Collector: Data saved to CSV: {csv_file_path}")
-    except Exception as e_csv:
-        error_logger.error(f"Failed to save CSV '{csv_file_path}': {e_csv}")
+    # Written in the background; setup_vector_store waits on the JSON before reading it back.
+    data_files_future = DATA_FILE_EXECUTOR.submit(write_data_source_files, json_file_path, csv_file_path, all_fetched_data)
+    _pending_data_file_writes[json_file_path] = data_files_future
+    data_files_future.add_done_callback(lambda _: _pending_data_file_writes.pop(json_file_path, None))
 
     save_state(current_state)
     logger.info("Market Data Collector: Node completed.")
-    return current_state.model_dump()
+    return {"report_dir": current_state.report_dir, "financial_data": current_state.financial_data, "raw_news_data": current_state.raw_news_data, "competitor_data": current_state.competitor_data}
+
+@functools.lru_cache(maxsize=8)
+def get_chat_model(model_name: str, temperature: float):
+    return init_chat_model(model_name=model_name, model_provider="google_genai", temperature=temperature)
+
+def prompt_json_dumps(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+_JSON_DECODER = json.JSONDecoder()
 
 def llm_json_parser_robust(llm_output_str: str, default_return_val: Any = None) -> Any:
-    logger.debug(f"LLM JSON Parser: Attempting to parse: {llm_output_str[:200]}...")
+    logger.debug("LLM JSON Parser: Attempting to parse: %.200s...", llm_output_str)
     try:
-        cleaned_llm_output = re.sub(r"```json\s*([\s\S]*?)\s*```", r"\1", llm_output_str.strip(), flags=re.IGNORECASE)
+        direct_parsed_json = orjson.loads(llm_output_str)
+        if isinstance(direct_parsed_json, (dict, list)):
+            logger.debug("LLM JSON Parser: Parsed well-formed output directly.")
+            return direct_parsed_json
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        cleaned_llm_output = _JSON_FENCE_RE.sub(r"\1", llm_output_str.strip())
         start_brace = cleaned_llm_output.find('{')
         start_bracket = cleaned_llm_output.find('[')
         if start_brace == -1 and start_bracket == -1:
@@ -653,49 +1423,84 @@ def llm_json_parser_robust(llm_output_str: str, default_return_val: Any = None)
             return default_return_val if default_return_val is not None else []
         json_start_char = '{' if (start_brace != -1 and (start_bracket == -1 or start_brace < start_bracket)) else '['
         json_start_index = start_brace if json_start_char == '{' else start_bracket
-        open_count = 0
-        json_end_index = -1
-        for i in range(json_start_index, len(cleaned_llm_output)):
-            if cleaned_llm_output[i] == json_start_char:
-                open_count += 1
-            elif (json_start_char == '{' and cleaned_llm_output[i] == '}') or \
-                 (json_start_char == '[' and cleaned_llm_output[i] == ']'):
-                open_count -= 1
-            if open_count == 0:
-                json_end_index = i
-                break
-        if json_end_index == -1:
-            logger.warning(f"LLM JSON Parser: Could not find matching end for '{json_start_char}'. Output: {cleaned_llm_output[:200]}")
-            return default_return_val if default_return_val is not None else []
-        json_str_to_parse = cleaned_llm_output[json_start_index:json_end_index + 1]
-        parsed_json = json.loads(json_str_to_parse)
+        # raw_decode scans from the first bracket in C and stops at the end of the first complete value,
+        # so brackets inside strings and trailing prose are handled without a manual depth count.
+        parsed_json, _ = _JSON_DECODER.raw_decode(cleaned_llm_output, json_start_index)
         logger.debug("LLM JSON Parser: Successfully parsed JSON.")
         return parsed_json
     except json.JSONDecodeError as e_json_decode:
-        error_logger.warning(f"LLM JSON Parser: Parsing failed: {e_json_decode}. String attempted: '{json_str_to_parse[:500] if 'json_str_to_parse' in locals() else cleaned_llm_output[:500]}'")
+        error_logger.warning("LLM JSON Parser: Parsing failed: %s. String attempted: '%.500s'", e_json_decode, cleaned_llm_output[json_start_index:] if 'json_start_index' in locals() else cleaned_llm_output)
         return default_return_val if default_return_val is not None else []
 
+# Fallbacks used when a node's LLM call fails or there is nothing to analyze
+DEFAULT_MARKET_TRENDS = [{"trend_name": "Default Trend", "description": "No specific trends identified.", "supporting_evidence": "N/A", "estimated_impact": "Unknown", "timeframe": "Unknown"}]
+DEFAULT_OPPORTUNITIES = [{"opportunity_name": "Default Opportunity", "description": "N/A"}]
+DEFAULT_STRATEGIES = [{"strategy_title": "Default Strategy", "description": "N/A"}]
+
+def has_generated_items(items: List[Dict[str, Any]], default_items: List[Dict[str, Any]]) -> bool:
+    return bool(items) and items != default_items
+
+@functools.lru_cache(maxsize=1)
+def get_trend_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are an expert market analyst. Identify key trends for the market named in the request from the provided data. Return a JSON array of objects, each with 'trend_name' (string), 'description' (string), 'supporting_evidence' (string, cite sources if possible), 'estimated_impact' ('High'/'Medium'/'Low'), 'timeframe' ('Short-term'/'Medium-term'/'Long-term'). Aim for 3-5 trends."),
+        ("human", "Data for {market_domain} (Query: {query}):\n\nNews/Competitor Info (sample):\n{input_json_data}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.2) | StrOutputParser()
+
+@functools.lru_cache(maxsize=1)
+def get_opportunity_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Identify market opportunities for the market named in the request based on trends, news, and competitor data. Return JSON array: 'opportunity_name', 'description', 'target_segment', 'competitive_advantage', 'estimated_potential' (High/Medium/Low), 'timeframe_to_capture'. Min 2-3."),
+        ("human", "Context for {market_domain}:\nTrends: {trends_json}\nNews/Competitors (sample): {data_json}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.3) | StrOutputParser()
+
+@functools.lru_cache(maxsize=1)
+def get_strategy_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Recommend strategies for the market named in the request based on opportunities, trends, and competitor data. Return JSON array: 'strategy_title', 'description', 'implementation_steps' (list), 'expected_outcome', 'resource_requirements', 'priority_level', 'success_metrics'. Min 2-3."),
+        ("human", "Context for {market_domain}:\nOpportunities: {ops_json}\nTrends: {trends_json}\nCompetitors (sample): {comp_json}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.3) | StrOutputParser()
+
+@functools.lru_cache(maxsize=1)
+def get_report_template_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Create a markdown report template for the market and query given in the request. Sections: Title, Date, Prepared By, Executive Summary, Key Trends (name, desc, impact, timeframe), Opportunities (name, desc, potential), Recommendations (title, desc, priority), Competitive Landscape, Visualizations (placeholders like ![Chart Description](filename.png)), Appendix. No ```markdown``` fences."),
+        ("human", "Generate template for market: {market_domain}, query: {query}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.1) | StrOutputParser()
+
+PROMPT_SAMPLE_SIZE = 5
+
+def competitor_prompt_sample(state_obj: MarketIntelligenceState, news_sample: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # competitor_data is usually the same article list as raw_news_data; drop items the news sample already carries
+    # so prompts that take both samples do not send the same documents twice.
+    news_sample_urls = {item.get("url") for item in news_sample}
+    return [item for item in state_obj.competitor_data[:PROMPT_SAMPLE_SIZE] if item.get("url") not in news_sample_urls]
+
 async def trend_analyzer(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Trend Analyzer: Domain='{current_state.market_domain}'")
-    default_trends_list = [{"trend_name": "Default Trend", "description": "No specific trends identified.", "supporting_evidence": "N/A", "estimated_impact": "Unknown", "timeframe": "Unknown"}]
+    default_trends_list = DEFAULT_MARKET_TRENDS
+    # Resolving bodies is SQLite reads plus zstd decompression, so it stays off the event loop
+    limited_news_data = await asyncio.to_thread(resolve_page_contents, current_state.raw_news_data[:PROMPT_SAMPLE_SIZE])
+    limited_competitor_data = await asyncio.to_thread(resolve_page_contents, competitor_prompt_sample(current_state, current_state.raw_news_data[:PROMPT_SAMPLE_SIZE]))
+    if not limited_news_data and not limited_competitor_data:
+        logger.warning("Trend Analyzer: No news or competitor data collected; skipping LLM call and using default trends.")
+        current_state.market_trends = default_trends_list
+        return {"market_trends": current_state.market_trends}
     try:
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Trend Analyzer (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.2)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert market analyst for {market_domain}. Identify key trends from the provided data. Return a JSON array of objects, each with 'trend_name' (string), 'description' (string), 'supporting_evidence' (string, cite sources if possible), 'estimated_impact' ('High'/'Medium'/'Low'), 'timeframe' ('Short-term'/'Medium-term'/'Long-term'). Aim for 3-5 trends."),
-            ("human", "Data for {market_domain} (Query: {query}):\n\nNews/Competitor Info (sample):\n{input_json_data}")
-        ])
-        chain = prompt | llm | StrOutputParser()
-        limited_news_data = current_state.raw_news_data[:5] if current_state.raw_news_data else []
-        limited_competitor_data = current_state.competitor_data[:5] if current_state.competitor_data else []
+        chain = get_trend_chain()
         input_data_for_llm = {"news_sample": limited_news_data, "competitors_sample": limited_competitor_data}
         logger.info(f"Trend Analyzer: Invoking LLM. News items: {len(limited_news_data)}, Competitor items: {len(limited_competitor_data)}")
         llm_output_string = await chain.ainvoke({ # Use ainvoke
             "market_domain": current_state.market_domain,
             "query": current_state.query or "general",
-            "input_json_data": json.dumps(input_data_for_llm)
+            "input_json_data": prompt_json_dumps(input_data_for_llm)
         })
         parsed_trends = llm_json_parser_robust(llm_output_string, default_return_val=default_trends_list)
         if not isinstance(parsed_trends, list) or not all(isinstance(t, dict) for t in parsed_trends):
@@ -704,68 +1509,66 @@ async def trend_analyzer(current_state: MarketIntelligenceState) -> Dict[str, An
         logger.info(f"Trend Analyzer: Identified {len(parsed_trends)} trends.")
         current_state.market_trends = parsed_trends
     except Exception as e_trend:
+        raise_if_resumable(e_trend)
         error_logger.error(f"Trend Analyzer: Failed for '{current_state.market_domain}': {e_trend}\n{traceback.format_exc()}")
         current_state.market_trends = default_trends_list
-    save_state(current_state)
     logger.info("Trend Analyzer: Node completed.")
-    return current_state.model_dump()
+    return {"market_trends": current_state.market_trends}
 
 async def opportunity_identifier(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Opportunity Identifier: Domain='{current_state.market_domain}'")
-    default_ops = [{"opportunity_name": "Default Opportunity", "description": "N/A"}]
+    default_ops = DEFAULT_OPPORTUNITIES
+    limited_news = await asyncio.to_thread(resolve_page_contents, current_state.raw_news_data[:PROMPT_SAMPLE_SIZE])
+    if not limited_news and not has_generated_items(current_state.market_trends, DEFAULT_MARKET_TRENDS):
+        logger.warning("Opportunity Identifier: No news or trends to work from; skipping LLM call and using default opportunities.")
+        current_state.opportunities = default_ops
+        return {"opportunities": current_state.opportunities}
     try:
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Opportunity Identifier (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.3)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Identify market opportunities for {market_domain} based on trends, news, and competitor data. Return JSON array: 'opportunity_name', 'description', 'target_segment', 'competitive_advantage', 'estimated_potential' (High/Medium/Low), 'timeframe_to_capture'. Min 2-3."),
-            ("human", "Context for {market_domain}:\nTrends: {trends_json}\nNews/Competitors (sample): {data_json}")
-        ])
-        chain = prompt | llm | StrOutputParser()
-        limited_news = current_state.raw_news_data[:5] if current_state.raw_news_data else []
+        chain = get_opportunity_chain()
         llm_output = await chain.ainvoke({ # Use ainvoke
             "market_domain": current_state.market_domain,
-            "trends_json": json.dumps(current_state.market_trends[:5] if current_state.market_trends else []),
-            "data_json": json.dumps({"news_sample": limited_news})
+            "trends_json": prompt_json_dumps(current_state.market_trends[:5] if current_state.market_trends else []),
+            "data_json": prompt_json_dumps({"news_sample": limited_news})
         })
         parsed_ops = llm_json_parser_robust(llm_output, default_return_val=default_ops)
         current_state.opportunities = parsed_ops if isinstance(parsed_ops, list) else default_ops
     except Exception as e:
+        raise_if_resumable(e)
         error_logger.error(f"Opportunity Identifier failed: {e}\n{traceback.format_exc()}")
         current_state.opportunities = default_ops
-    save_state(current_state)
     logger.info(f"Opportunity Identifier: Found {len(current_state.opportunities)} opportunities.")
-    return current_state.model_dump()
+    return {"opportunities": current_state.opportunities}
 
 async def strategy_recommender(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Strategy Recommender: Domain='{current_state.market_domain}'")
-    default_strats = [{"strategy_title": "Default Strategy", "description": "N/A"}]
+    default_strats = DEFAULT_STRATEGIES
+    limited_comp = await asyncio.to_thread(resolve_page_contents, current_state.competitor_data[:PROMPT_SAMPLE_SIZE])
+    if not limited_comp and not has_generated_items(current_state.opportunities, DEFAULT_OPPORTUNITIES) and not has_generated_items(current_state.market_trends, DEFAULT_MARKET_TRENDS):
+        logger.warning("Strategy Recommender: No opportunities, trends or competitor data; skipping LLM call and using default strategies.")
+        current_state.strategic_recommendations = default_strats
+        return {"strategic_recommendations": current_state.strategic_recommendations}
     try:
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Strategy Recommender (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.3)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Recommend strategies for {market_domain} based on opportunities, trends, and competitor data. Return JSON array: 'strategy_title', 'description', 'implementation_steps' (list), 'expected_outcome', 'resource_requirements', 'priority_level', 'success_metrics'. Min 2-3."),
-            ("human", "Context for {market_domain}:\nOpportunities: {ops_json}\nTrends: {trends_json}\nCompetitors (sample): {comp_json}")
-        ])
-        chain = prompt | llm | StrOutputParser()
-        limited_comp = current_state.competitor_data[:5] if current_state.competitor_data else []
+        chain = get_strategy_chain()
         llm_output = await chain.ainvoke({ # Use ainvoke
             "market_domain": current_state.market_domain,
-            "ops_json": json.dumps(current_state.opportunities[:5] if current_state.opportunities else []),
-            "trends_json": json.dumps(current_state.market_trends[:5] if current_state.market_trends else []),
-            "comp_json": json.dumps({"competitors_sample": limited_comp})
+            "ops_json": prompt_json_dumps(current_state.opportunities[:5] if current_state.opportunities else []),
+            "trends_json": prompt_json_dumps(current_state.market_trends[:5] if current_state.market_trends else []),
+            "comp_json": prompt_json_dumps({"competitors_sample": limited_comp})
         })
         parsed_strats = llm_json_parser_robust(llm_output, default_return_val=default_strats)
         current_state.strategic_recommendations = parsed_strats if isinstance(parsed_strats, list) else default_strats
     except Exception as e:
+        raise_if_resumable(e)
         error_logger.error(f"Strategy Recommender failed: {e}\n{traceback.format_exc()}")
         current_state.strategic_recommendations = default_strats
-    save_state(current_state)
     logger.info(f"Strategy Recommender: Generated {len(current_state.strategic_recommendations)} strategies.")
-    return current_state.model_dump()
+    return {"strategic_recommendations": current_state.strategic_recommendations}
 
 async def report_template_generator(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Report Template Generator: Domain='{current_state.market_domain}'")
@@ -774,53 +1577,264 @@ async def report_template_generator(current_state: MarketIntelligenceState) -> D
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Report Template Generator (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.1)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Create a markdown report template for {market_domain} on query '{query}'. Sections: Title, Date, Prepared By, Executive Summary, Key Trends (name, desc, impact, timeframe), Opportunities (name, desc, potential), Recommendations (title, desc, priority), Competitive Landscape, Visualizations (placeholders like ![Chart Description](filename.png)), Appendix. No ```markdown``` fences."),
-            ("human", "Generate template for market: {market_domain}, query: {query}")
-        ])
-        chain = prompt | llm | StrOutputParser()
+        chain = get_report_template_chain()
         generated_template = await chain.ainvoke({ # Use ainvoke
             "market_domain": current_state.market_domain,
             "query": current_state.query or "General Overview"
         })
         current_state.report_template = generated_template.replace("```markdown", "").replace("```", "").strip() or default_tmpl
     except Exception as e:
+        raise_if_resumable(e)
         error_logger.error(f"Report Template Generator failed: {e}\n{traceback.format_exc()}")
         current_state.report_template = default_tmpl
-    save_state(current_state)
     logger.info(f"Report Template Generator: Template length {len(current_state.report_template)}.")
-    return current_state.model_dump()
+    return {"report_template": current_state.report_template}
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# "torch" (default) or "onnx-int8". The int8 ONNX exports ship in the model repo; pick the file matching the CPU
+# (model_qint8_avx512_vnni.onnx, model_qint8_avx512.onnx, model_quint8_avx2.onnx, model_qint8_arm64.onnx).
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "torch").lower()
+EMBEDDINGS_ONNX_FILE = os.getenv("EMBEDDINGS_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+FASTEMBED_MODEL_NAME = os.getenv("FASTEMBED_MODEL_NAME", "BAAI/bge-small-en-v1.5")
+
+class OnnxSentenceEmbeddings(Embeddings):
+    def __init__(self, model_name: str, onnx_file_name: str, batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": onnx_file_name})
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, show_progress_bar=False).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode(text, normalize_embeddings=True, show_progress_bar=False).tolist()
+
+# RAG questions repeat across runs over the same corpus; the query vector only depends on the text and the model
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+class QueryCachedEmbeddings(Embeddings):
+    def __init__(self, base_embeddings: Embeddings):
+        self.base_embeddings = base_embeddings
+        self._embed_query_cached = functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(self._embed_query_uncached)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base_embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return list(self._embed_query_cached(text))
+
+    def _embed_query_uncached(self, text: str) -> Tuple[float, ...]:
+        return tuple(self.base_embeddings.embed_query(text))
+
+def _embedding_device() -> str:
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+@locked_singleton
+def get_embeddings() -> Embeddings:
+    if EMBEDDINGS_BACKEND == "onnx-int8":
+        logger.info(f"Embeddings: Loading '{EMBEDDING_MODEL_NAME}' via ONNX Runtime ({EMBEDDINGS_ONNX_FILE}).")
+        return OnnxSentenceEmbeddings(EMBEDDING_MODEL_NAME, EMBEDDINGS_ONNX_FILE)
+    if EMBEDDINGS_BACKEND == "fastembed":
+        logger.info(f"Embeddings: Loading '{FASTEMBED_MODEL_NAME}' via FastEmbed (ONNX Runtime).")
+        from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+        return FastEmbedEmbeddings(model_name=FASTEMBED_MODEL_NAME, threads=os.cpu_count(), batch_size=64)
+    embedding_device = _embedding_device()
+    logger.info(f"Embeddings: Loading '{EMBEDDING_MODEL_NAME}' on {embedding_device}.")
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': embedding_device},
+        encode_kwargs={'batch_size': 64, 'normalize_embeddings': True}
+    )
+
+@locked_singleton
+def get_query_embeddings() -> Embeddings:
+    return QueryCachedEmbeddings(get_embeddings())
+
+# IVF1024 needs roughly 39 training vectors per centroid; below that a flat index is both exact and faster to build.
+FAISS_IVFPQ_MIN_VECTORS = 40000
+FAISS_IVFPQ_FACTORY = "IVF1024,PQ32"
+FAISS_IVFPQ_NPROBE = 16
+# Between the two thresholds an HNSW graph keeps queries sub-linear without the IVF training pass. Its vectors are
+# stored as 8-bit scalar codes (a quarter of float32); the quantizer only needs per-dimension ranges, a single cheap pass.
+FAISS_HNSW_MIN_VECTORS = 10000
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 64
+FAISS_HNSW_EF_SEARCH = 64
+
+@functools.lru_cache(maxsize=1)
+def get_embeddings_model_tag() -> str:
+    if EMBEDDINGS_BACKEND == "fastembed":
+        return f"{FASTEMBED_MODEL_NAME}|{EMBEDDINGS_BACKEND}|"
+    return f"{EMBEDDING_MODEL_NAME}|{EMBEDDINGS_BACKEND}|{EMBEDDINGS_ONNX_FILE if EMBEDDINGS_BACKEND == 'onnx-int8' else ''}"
+
+def embedding_cache_key(text_val: str) -> str:
+    # The model and backend are part of the key: fp32 and int8 vectors for the same text must not be mixed
+    model_tag = get_embeddings_model_tag()
+    return hashlib.blake2b(f"{model_tag}\n{text_val}".encode("utf-8"), digest_size=16).hexdigest()
+
+def embed_texts_cached(embeddings_model: Embeddings, texts_to_embed: List[str]) -> np.ndarray:
+    content_hashes = [embedding_cache_key(text_val) for text_val in texts_to_embed]
+    cached_vectors = load_cached_embeddings(list(set(content_hashes)))
+    texts_to_compute = {}
+    for content_hash, text_val in zip(content_hashes, texts_to_embed):
+        if content_hash not in cached_vectors:
+            texts_to_compute.setdefault(content_hash, text_val)
+    logger.info(f"VS Setup: Embedding cache hits {len(texts_to_embed) - len(texts_to_compute)}/{len(texts_to_embed)} chunks.")
+    if texts_to_compute:
+        computed_vectors = np.asarray(embeddings_model.embed_documents(list(texts_to_compute.values())), dtype="float32")
+        fresh_vectors = dict(zip(texts_to_compute.keys(), computed_vectors))
+        save_cached_embeddings(list(fresh_vectors.items()))
+        cached_vectors.update(fresh_vectors)
+    return np.vstack([cached_vectors[content_hash] for content_hash in content_hashes])
+
+def build_faiss_index(texts_to_index: List[str], metadatas_to_index: List[Dict[str, Any]]) -> "FAISS":
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    embeddings_model = get_embeddings()
+    chunk_vectors = embed_texts_cached(embeddings_model, texts_to_index)
+    # Unit vectors make L2 ranking identical to cosine ranking whatever the backend returns;
+    # the stores are built with normalize_L2=True so query vectors get the same treatment.
+    faiss.normalize_L2(chunk_vectors)
+    vector_dim = chunk_vectors.shape[1]
+
+    if len(texts_to_index) >= FAISS_IVFPQ_MIN_VECTORS:
+        raw_index = faiss.index_factory(vector_dim, FAISS_IVFPQ_FACTORY)
+        if hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0:
+            logger.info(f"VS Setup: Training {FAISS_IVFPQ_FACTORY} index on GPU for {len(texts_to_index)} vectors.")
+            gpu_resources = faiss.StandardGpuResources()
+            gpu_index = faiss.index_cpu_to_gpu(gpu_resources, 0, raw_index)
+            gpu_index.train(chunk_vectors)
+            gpu_index.add(chunk_vectors)
+            raw_index = faiss.index_gpu_to_cpu(gpu_index)
+        else:
+            logger.info(f"VS Setup: Training {FAISS_IVFPQ_FACTORY} index on CPU for {len(texts_to_index)} vectors.")
+            raw_index.train(chunk_vectors)
+            raw_index.add(chunk_vectors)
+        faiss.extract_index_ivf(raw_index).nprobe = FAISS_IVFPQ_NPROBE
+    elif len(texts_to_index) >= FAISS_HNSW_MIN_VECTORS:
+        logger.info(f"VS Setup: Building HNSW{FAISS_HNSW_M},SQ8 index for {len(texts_to_index)} vectors.")
+        raw_index = faiss.IndexHNSWSQ(vector_dim, faiss.ScalarQuantizer.QT_8bit, FAISS_HNSW_M)
+        raw_index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        raw_index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        raw_index.train(chunk_vectors)
+        raw_index.add(chunk_vectors)
+    else:
+        raw_index = faiss.IndexFlatL2(vector_dim)
+        raw_index.add(chunk_vectors)
+
+    docstore_ids = [str(uuid4()) for _ in texts_to_index]
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=chunk_text, metadata=chunk_metadata)
+        for doc_id, chunk_text, chunk_metadata in zip(docstore_ids, texts_to_index, metadatas_to_index)
+    })
+    return FAISS(embeddings_model, raw_index, docstore, dict(enumerate(docstore_ids)), normalize_L2=True)
+
+# Keyed on the index file's mtime so a rebuilt store at the same path is reloaded
+@functools.lru_cache(maxsize=4)
+def _load_vector_store_cached(vs_path: str, index_mtime: float) -> "FAISS":
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    # Same layout as FAISS.save_local, but the index is memory-mapped read-only instead of copied into RAM
+    raw_index = faiss.read_index(os.path.join(vs_path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if isinstance(raw_index, faiss.IndexHNSW):
+        raw_index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    with open(os.path.join(vs_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(get_query_embeddings(), raw_index, docstore, index_to_docstore_id, normalize_L2=True)
+
+def load_vector_store(vs_path: str) -> "FAISS":
+    return _load_vector_store_cached(vs_path, os.path.getmtime(os.path.join(vs_path, "index.faiss")))
+
+# The splitter is pure Python, so only a process pool parallelizes it; below this much text the pool startup costs more than it saves
+VS_SPLIT_PARALLEL_MIN_CHARS = 2_000_000
+
+def split_texts_for_vs(text_splitter: "RecursiveCharacterTextSplitter", contents: List[str]) -> List[List[str]]:
+    if len(contents) < 2 or sum(map(len, contents)) < VS_SPLIT_PARALLEL_MIN_CHARS:
+        return [text_splitter.split_text(content) for content in contents]
+    split_workers = min(len(contents), os.cpu_count() or 1)
+    logger.info(f"VS Setup: Splitting {len(contents)} documents across {split_workers} processes.")
+    with ProcessPoolExecutor(max_workers=split_workers) as split_pool:
+        return list(split_pool.map(text_splitter.split_text, contents, chunksize=max(1, len(contents) // (split_workers * 4))))
+
+def dedupe_chunks_for_vs(chunk_texts: List[str], chunk_metadatas: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    # Syndicated articles split into identical chunks; index each chunk once and list the other sources on it
+    unique_chunks = {}
+    for chunk_text, chunk_metadata in zip(chunk_texts, chunk_metadatas):
+        chunk_key = hashlib.blake2b(chunk_text.encode("utf-8"), digest_size=16).digest()
+        kept_chunk = unique_chunks.get(chunk_key)
+        if kept_chunk is None:
+            unique_chunks[chunk_key] = (chunk_text, dict(chunk_metadata))
+            continue
+        duplicate_source = chunk_metadata.get("url") or chunk_metadata.get("source")
+        kept_metadata = kept_chunk[1]
+        if duplicate_source and duplicate_source != (kept_metadata.get("url") or kept_metadata.get("source")):
+            duplicate_sources = kept_metadata.setdefault("duplicate_sources", [])
+            if duplicate_source not in duplicate_sources:
+                duplicate_sources.append(duplicate_source)
+    if len(unique_chunks) < len(chunk_texts):
+        logger.info(f"VS Setup: Dropped {len(chunk_texts) - len(unique_chunks)} duplicate chunks of {len(chunk_texts)}.")
+    return [chunk[0] for chunk in unique_chunks.values()], [chunk[1] for chunk in unique_chunks.values()]
+
+def iter_data_source_items(json_file_path: str) -> Iterable[Dict[str, Any]]:
+    # ijson yields one article at a time, so the parsed file is never held alongside the chunk texts built from it
+    with open(json_file_path, "rb") as f:
+        if ijson is not None:
+            yield from ijson.items(f, "item")
+        else:
+            yield from orjson.loads(f.read())
 
 def get_vector_store_path(current_state: MarketIntelligenceState) -> str:
     base_dir = get_agent_base_reports_dir()
-    report_specific_dir = current_state.report_dir or os.path.join(base_dir, f"VS_FALLBACK_{current_state.state_id[:4]}")
+    report_specific_dir = current_state.report_dir or os.path.join(base_dir, f"VS_FALLBACK_{current_state.short_state_id}")
     if not os.path.isabs(report_specific_dir):
         report_specific_dir = os.path.join(base_dir, report_specific_dir)
-    os.makedirs(report_specific_dir, exist_ok=True)
-    return os.path.join(report_specific_dir, f"vector_store_faiss_{current_state.state_id[:4]}")
+    ensure_dir(report_specific_dir)
+    return os.path.join(report_specific_dir, f"vector_store_faiss_{current_state.short_state_id}")
+
+VECTOR_STORE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-store")
+_pending_vector_store_builds = {}
+atexit.register(VECTOR_STORE_EXECUTOR.shutdown, wait=True)
+
+def build_and_save_vector_store(texts_for_vs: List[str], metadatas_for_vs: List[Dict[str, Any]], vs_save_path: str):
+    build_faiss_index(texts_for_vs, metadatas_for_vs).save_local(vs_save_path)
+    logger.info(f"VS Setup: FAISS index saved to: {vs_save_path} with {len(texts_for_vs)} chunks.")
 
-async def setup_vector_store(current_state: MarketIntelligenceState) -> Dict[str, Any]: # Changed to async, though FAISS is sync
+async def wait_for_vector_store_build(current_state: MarketIntelligenceState):
+    pending_build = _pending_vector_store_builds.pop(current_state.vector_store_path, None) if current_state.vector_store_path else None
+    if pending_build is None:
+        return
+    try:
+        await asyncio.wrap_future(pending_build)
+    except Exception as e_vs_build:
+        error_logger.error(f"VS Setup: Background FAISS build for '{current_state.vector_store_path}' failed: {e_vs_build}")
+        current_state.vector_store_path = None
+
+async def setup_vector_store(current_state: MarketIntelligenceState) -> Dict[str, Any]: # FAISS is sync, so the heavy steps run via asyncio.to_thread
     logger.info(f"Vector Store Setup: StateID='{current_state.state_id}'")
     if not current_state.report_dir:
-        current_state.report_dir = os.path.join(get_agent_base_reports_dir(), f"VS_SETUP_FALLBACK_DIR_{current_state.state_id[:4]}")
-        os.makedirs(current_state.report_dir, exist_ok=True)
+        current_state.report_dir = os.path.join(get_agent_base_reports_dir(), f"VS_SETUP_FALLBACK_DIR_{current_state.short_state_id}")
+        ensure_dir(current_state.report_dir)
         logger.warning(f"report_dir was not set, using fallback: {current_state.report_dir}")
 
-    vs_data_json_path = os.path.join(current_state.report_dir, f"{current_state.market_domain.lower().replace(' ', '_')}_data_sources.json")
-    docs_for_vs = []
+    vs_data_json_path = os.path.join(current_state.report_dir, current_state.data_json_basename)
+    pending_data_files_write = _pending_data_file_writes.get(vs_data_json_path)
+    if pending_data_files_write is not None:
+        await asyncio.wrap_future(pending_data_files_write)
+    doc_contents_vs, doc_metadatas_vs = [], []
 
     if os.path.exists(vs_data_json_path):
         try:
-            with open(vs_data_json_path, "r", encoding="utf-8") as f:
-                data_items = json.load(f)
-                for item in data_items:
-                    content = item.get('full_content') or item.get('summary', '')
-                    if content:
-                        docs_for_vs.append({
-                            "content": f"Title: {item.get('title', 'N/A')}\nURL: {item.get('url', 'N/A')}\nContent: {content}",
-                            "metadata": {"source": "web_document", "url": item.get('url'), "title": item.get('title')}
-                        })
+            for item in iter_data_source_items(vs_data_json_path):
+                item_content = item.get('full_content') or item.get('summary')
+                if item_content:
+                    doc_contents_vs.append(f"Title: {item.get('title', 'N/A')}\nURL: {item.get('url', 'N/A')}\nContent: {item_content}")
+                    doc_metadatas_vs.append({"source": "web_document", "url": item.get('url'), "title": item.get('title')})
         except Exception as e:
             error_logger.error(f"VS Setup: Error reading '{vs_data_json_path}': {e}")
 
@@ -831,92 +1845,169 @@ async def setup_vector_store(current_state: MarketIntelligenceState) -> Dict[str
     }
     for type_name, content_items in generated_content_map.items():
         if content_items:
-            docs_for_vs.append({
-                "content": f"{type_name} for {current_state.market_domain} (Query: {current_state.query or 'N/A'}):\n{json.dumps(content_items, indent=2)}",
-                "metadata": {"source": f"agent_generated_{type_name.lower().replace(' ', '_')}"}
-            })
+            doc_contents_vs.append(f"{type_name} for {current_state.market_domain} (Query: {current_state.query or 'N/A'}):\n{orjson.dumps(content_items, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()}")
+            doc_metadatas_vs.append({"source": f"agent_generated_{type_name.lower().replace(' ', '_')}"})
 
-    if not docs_for_vs:
+    if not doc_contents_vs:
         logger.warning("VS Setup: No documents to add to vector store.")
         current_state.vector_store_path = None
-        save_state(current_state)
-        return current_state.model_dump()
+        return {"report_dir": current_state.report_dir, "vector_store_path": current_state.vector_store_path}
 
     try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         text_splitter_vs = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150, add_start_index=True)
         texts_for_vs, metadatas_for_vs = [], []
-        for doc_item_vs in docs_for_vs:
-            chunks_vs = text_splitter_vs.split_text(doc_item_vs["content"])
-            for chunk_text_vs in chunks_vs:
-                texts_for_vs.append(chunk_text_vs)
-                metadatas_for_vs.append(doc_item_vs["metadata"])
+        for doc_metadata_vs, chunks_vs in zip(doc_metadatas_vs, await asyncio.to_thread(split_texts_for_vs, text_splitter_vs, doc_contents_vs)):
+            texts_for_vs.extend(chunks_vs)
+            metadatas_for_vs.extend([doc_metadata_vs] * len(chunks_vs))
+        texts_for_vs, metadatas_for_vs = dedupe_chunks_for_vs(texts_for_vs, metadatas_for_vs)
 
         if not texts_for_vs:
             logger.warning("VS Setup: No text chunks after splitting. VS not created.")
             current_state.vector_store_path = None
         else:
-            embeddings_vs = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2", model_kwargs={'device': 'cpu'})
-            faiss_index = FAISS.from_texts(texts_for_vs, embeddings_vs, metadatas=metadatas_for_vs)
             vs_save_path = get_vector_store_path(current_state)
-            faiss_index.save_local(vs_save_path)
+            if current_state.question:
+                await asyncio.to_thread(build_and_save_vector_store, texts_for_vs, metadatas_for_vs, vs_save_path)
+            else:
+                # Nothing in this run queries the store, so the embedding work overlaps the report LLM call;
+                # the report node waits for it before the README records the store.
+                _pending_vector_store_builds[vs_save_path] = VECTOR_STORE_EXECUTOR.submit(build_and_save_vector_store, texts_for_vs, metadatas_for_vs, vs_save_path)
+                logger.info(f"VS Setup: Building FAISS index for {len(texts_for_vs)} chunks in the background.")
             current_state.vector_store_path = vs_save_path
-            logger.info(f"VS Setup: FAISS index saved to: {vs_save_path} with {len(texts_for_vs)} chunks.")
     except Exception as e_vs_create:
         error_logger.error(f"VS Setup: Failed to create FAISS index: {e_vs_create}\n{traceback.format_exc()}")
         current_state.vector_store_path = None
 
-    save_state(current_state)
     logger.info("Vector Store Setup: Node completed.")
-    return current_state.model_dump()
+    return {"report_dir": current_state.report_dir, "vector_store_path": current_state.vector_store_path}
+
+# Optional cross-encoder rerank (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2): a wider candidate set is scored in one
+# batched forward pass and only the best RAG_CONTEXT_DOCS reach the prompt. Unset keeps plain top-k retrieval.
+RAG_RERANK_MODEL_NAME = os.getenv("RAG_RERANK_MODEL", "")
+RAG_RERANK_CANDIDATES = 32
+RAG_CONTEXT_DOCS = 4
+
+@functools.lru_cache(maxsize=1)
+def get_rag_reranker():
+    from sentence_transformers import CrossEncoder
+    logger.info(f"RAG Query: Loading rerank model '{RAG_RERANK_MODEL_NAME}' on {_embedding_device()}.")
+    return CrossEncoder(RAG_RERANK_MODEL_NAME, device=_embedding_device())
+
+def rerank_rag_documents(question: str, candidate_docs: List[Document]) -> List[Document]:
+    if len(candidate_docs) <= 1:
+        return candidate_docs
+    rerank_scores = get_rag_reranker().predict([(question, doc.page_content) for doc in candidate_docs], batch_size=64)
+    ranked_positions = sorted(range(len(candidate_docs)), key=lambda i: rerank_scores[i], reverse=True)
+    return [candidate_docs[i] for i in ranked_positions[:RAG_CONTEXT_DOCS]]
+
+# The score threshold is an absolute relevance score, but SQ8 and PQ indexes return distances between 8-bit or PQ codes.
+# On those tiers a wider candidate set is pulled without the threshold and re-scored against the exact float vectors
+# (mostly embedding-cache hits, since the index was built from the same chunks) before the threshold is applied.
+RAG_SCORE_THRESHOLD = 0.6
+RAG_RESCORE_OVERSAMPLE = 4
+
+def search_rag_documents(loaded_vs: "FAISS", question: str, retrieval_k: int) -> List[Document]:
+    import faiss
+    if isinstance(loaded_vs.index, faiss.IndexFlat):
+        return [doc for doc, _ in loaded_vs.similarity_search_with_relevance_scores(question, k=retrieval_k, score_threshold=RAG_SCORE_THRESHOLD)]
+    query_vector = np.asarray([loaded_vs.embedding_function.embed_query(question)], dtype="float32")
+    faiss.normalize_L2(query_vector)
+    candidate_docs = [doc for doc, _ in loaded_vs.similarity_search_with_score_by_vector(query_vector[0].tolist(), k=retrieval_k * RAG_RESCORE_OVERSAMPLE)]
+    if not candidate_docs:
+        return []
+    candidate_vectors = embed_texts_cached(get_embeddings(), [doc.page_content for doc in candidate_docs])
+    faiss.normalize_L2(candidate_vectors)
+    # Squared L2, the same quantity IndexFlatL2 returns, so the flat tier's relevance function applies unchanged
+    exact_distances = ((candidate_vectors - query_vector) ** 2).sum(axis=1)
+    relevance_score_fn = loaded_vs._select_relevance_score_fn()
+    scored_docs = sorted(
+        ((relevance_score_fn(float(distance)), doc) for distance, doc in zip(exact_distances, candidate_docs)),
+        key=lambda scored_doc: scored_doc[0], reverse=True
+    )
+    return [doc for score, doc in scored_docs[:retrieval_k] if score >= RAG_SCORE_THRESHOLD]
+
+RAG_NO_ANSWER_TEXT = "The provided information does not contain an answer to this question."
+
+RAG_CHAIN_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", f"Answer the question based ONLY on the provided context documents. If the answer isn't in the context, say '{RAG_NO_ANSWER_TEXT}' Be concise. Cite source URLs or titles from metadata if available and relevant."),
+    ("human", "Context:\n{context}\n\nQuestion: {question}\n\nAnswer:")
+])
+
+@functools.lru_cache(maxsize=1)
+def get_rag_answer_chain():
+    return RAG_CHAIN_PROMPT | get_chat_model("gemini-pro", 0.0) | StrOutputParser()
+
+# One buffered append handle per workflow run; flushed and fsynced once when the run finishes
+RAG_LOG_BUFFER_BYTES = 1 << 16
+_rag_log_handles: Dict[str, Any] = {}
+_rag_log_lock = threading.Lock()
+
+def append_rag_log(state_id_val: str, log_path: str, log_entry: str):
+    with _rag_log_lock:
+        log_handle = _rag_log_handles.get(state_id_val)
+        if log_handle is None:
+            log_handle = _rag_log_handles[state_id_val] = open(log_path, "a", encoding="utf-8", buffering=RAG_LOG_BUFFER_BYTES)
+        log_handle.write(log_entry)
+
+def close_rag_log(state_id_val: str):
+    with _rag_log_lock:
+        log_handle = _rag_log_handles.pop(state_id_val, None)
+    if log_handle is None:
+        return
+    try:
+        log_handle.flush()
+        os.fsync(log_handle.fileno())
+    except OSError as e_rag_log:
+        error_logger.error(f"Failed to flush RAG log for state {state_id_val}: {e_rag_log}")
+    finally:
+        log_handle.close()
 
 async def rag_query(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"RAG Query: Question='{current_state.question or 'N/A'}'")
     if not current_state.question:
         current_state.query_response = "No question provided for RAG."
-        save_state(current_state)
-        return current_state.model_dump()
+        return {"query_response": current_state.query_response}
 
     vs_path_to_load = current_state.vector_store_path
     if not vs_path_to_load or not os.path.isdir(vs_path_to_load):
         current_state.query_response = f"Error: Vector store not found or path is invalid ('{vs_path_to_load}'). Cannot answer question."
-        error_logger.warning(f"RAG Query: {current_state.query_response}")
-        save_state(current_state)
-        return current_state.model_dump()
+        error_logger.warning("RAG Query: %s", current_state.query_response)
+        return {"query_response": current_state.query_response}
 
     rag_answer = f"Error processing RAG query: '{current_state.question}'"
     try:
-        embeddings_rag = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2", model_kwargs={'device': 'cpu'})
-        loaded_vs = FAISS.load_local(vs_path_to_load, embeddings_rag, allow_dangerous_deserialization=True)
-        vs_retriever = loaded_vs.as_retriever(search_type="similarity_score_threshold", search_kwargs={"k": 4, "score_threshold": 0.6})
+        loaded_vs = await asyncio.to_thread(load_vector_store, vs_path_to_load)
+        retrieval_k = RAG_RERANK_CANDIDATES if RAG_RERANK_MODEL_NAME else RAG_CONTEXT_DOCS
 
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for RAG Query (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm_rag = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.0)
-        rag_chain_prompt = ChatPromptTemplate.from_messages([
-            ("system", "Answer the question based ONLY on the provided context documents. If the answer isn't in the context, say 'The provided information does not contain an answer to this question.' Be concise. Cite source URLs or titles from metadata if available and relevant."),
-            ("human", "Context:\n{context}\n\nQuestion: {question}\n\nAnswer:")
-        ])
-        qa_rag_chain = RetrievalQA.from_chain_type(llm=llm_rag, chain_type="stuff", retriever=vs_retriever, return_source_documents=True, chain_type_kwargs={"prompt": rag_chain_prompt})
-
-        # Use acall for RetrievalQA chains
-        result_from_chain = await qa_rag_chain.acall({"query": current_state.question})
-
-        rag_answer = result_from_chain.get("result", "No specific answer found in context.")
-        cited_sources_rag = [doc_rag.metadata.get('title') or doc_rag.metadata.get('url') or doc_rag.metadata.get('source', 'Unknown Source') for doc_rag in result_from_chain.get("source_documents", [])]
-
-        rag_log_file = os.path.join(current_state.report_dir, f"rag_responses_{current_state.state_id[:4]}.log")
-        with open(rag_log_file, "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now()}] Q: {current_state.question}\nA: {rag_answer}\nSources: {'; '.join(cited_sources_rag) or 'N/A'}\n---\n")
+        # Retrieve first: with nothing above the score threshold the prompt's own fallback answer is known without an LLM call
+        source_documents = await asyncio.to_thread(search_rag_documents, loaded_vs, current_state.question, retrieval_k)
+        if RAG_RERANK_MODEL_NAME and source_documents:
+            source_documents = await asyncio.to_thread(rerank_rag_documents, current_state.question, source_documents)
+        if not source_documents:
+            logger.info("RAG Query: No documents above the score threshold; skipping LLM call.")
+            rag_answer = RAG_NO_ANSWER_TEXT
+        else:
+            rag_answer = await get_rag_answer_chain().ainvoke({
+                "context": "\n\n".join(doc_rag.page_content for doc_rag in source_documents),
+                "question": current_state.question
+            }) or "No specific answer found in context."
+        cited_sources_rag = [doc_rag.metadata.get('title') or doc_rag.metadata.get('url') or doc_rag.metadata.get('source', 'Unknown Source') for doc_rag in source_documents]
+
+        rag_log_file = os.path.join(current_state.report_dir, current_state.rag_log_basename)
+        append_rag_log(current_state.state_id, rag_log_file, f"[{datetime.now()}] Q: {current_state.question}\nA: {rag_answer}\nSources: {'; '.join(cited_sources_rag) or 'N/A'}\n---\n")
         logger.info(f"RAG Query: Response logged to '{rag_log_file}'. Sources: {cited_sources_rag}")
     except Exception as e_rag:
+        raise_if_resumable(e_rag)
         error_logger.error(f"RAG Query failed: {e_rag}\n{traceback.format_exc()}")
         rag_answer = f"Error during RAG query: {str(e_rag)}"
 
     current_state.query_response = rag_answer
-    save_state(current_state)
     logger.info(f"RAG Query: Node completed. Response preview: '{rag_answer[:100]}...'")
-    return current_state.model_dump()
+    return {"query_response": current_state.query_response}
 
 def generate_report_charts(current_state: MarketIntelligenceState, output_dir_charts: str):
     logger.info(f"Chart Generation: Attempting to generate charts in {output_dir_charts}")
@@ -928,11 +2019,16 @@ def generate_report_charts(current_state: MarketIntelligenceState, output_dir_ch
         current_state.chart_paths = []
 
 def verify_report_file(file_path_to_check: str) -> bool:
-    if not file_path_to_check or not os.path.exists(file_path_to_check):
+    # One stat answers both existence and size
+    try:
+        report_file_stat = os.stat(file_path_to_check) if file_path_to_check else None
+    except OSError:
+        report_file_stat = None
+    if report_file_stat is None:
         error_logger.error(f"Report Verification: File not found at '{file_path_to_check}'")
         return False
-    if os.path.getsize(file_path_to_check) == 0:
-        error_logger.warning(f"Report Verification: File is empty at '{file_path_to_check}'")
+    if report_file_stat.st_size == 0:
+        error_logger.warning("Report Verification: File is empty at '%s'", file_path_to_check)
         return False
     logger.info(f"Report Verification: File '{file_path_to_check}' exists and is not empty.")
     return True
@@ -947,36 +2043,68 @@ def generate_readme(current_state: MarketIntelligenceState, output_dir_readme: s
 ## Report Files
 
 *   **Main Report:** [{report_filename_readme}](./{report_filename_readme})
-*   **Data (JSON):** [{current_state.market_domain.lower().replace(' ', '_')}_data_sources.json](./{current_state.market_domain.lower().replace(' ', '_')}_data_sources.json)
-*   **Data (CSV):** [{current_state.market_domain.lower().replace(' ', '_')}_data_sources.csv](./{current_state.market_domain.lower().replace(' ', '_')}_data_sources.csv)
-*   **Vector Store:** {'Present' if current_state.vector_store_path else 'Not Generated'} (Subdirectory: `{os.path.basename(current_state.vector_store_path)}` if present)
+*   **Data (JSON):** [{current_state.data_json_basename}](./{current_state.data_json_basename})
+*   **Data (CSV):** [{current_state.data_csv_basename}](./{current_state.data_csv_basename})
+*   **Vector Store:** {'Present' if current_state.vector_store_path else 'Not Generated'} (Subdirectory: `{current_state.vector_store_dirname or 'N/A'}` if present)
 *   **Execution Log:** [market_intelligence_run.log](./market_intelligence_run.log)
-*   **RAG Log:** [rag_responses_{current_state.state_id[:4]}.log](./rag_responses_{current_state.state_id[:4]}.log)
+*   **RAG Log:** [{current_state.rag_log_basename}](./{current_state.rag_log_basename})
 
 ## Charts
 """
-    for chart_file in current_state.chart_paths:
-        readme_content_str += f"*   ![{os.path.splitext(chart_file)[0].replace('_', ' ').title()}]({chart_file})\n"
-    readme_content_str += "\n## Notes\nThis report was automatically generated by the Market Intelligence Agent.\n"
+    readme_parts = [readme_content_str]
+    readme_parts.extend(f"*   ![{os.path.splitext(chart_file)[0].replace('_', ' ').title()}]({chart_file})\n" for chart_file in current_state.chart_paths)
+    readme_parts.append("\n## Notes\nThis report was automatically generated by the Market Intelligence Agent.\n")
+    readme_content_str = "".join(readme_parts)
     readme_file_path = os.path.join(output_dir_readme, "README.md")
     try:
-        # File I/O remains synchronous for now
         with open(readme_file_path, "w", encoding="utf-8") as f:
             f.write(readme_content_str)
         logger.info(f"README generated at: {readme_file_path}")
     except Exception as e_readme:
         error_logger.error(f"Failed to generate README.md: {e_readme}")
 
+@functools.lru_cache(maxsize=1)
+def get_report_from_template_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Fill the markdown template with the provided data for the market given in the request. Refer to charts using their filenames (e.g., ![Chart Description](chart_filename.png)). Use the date given in the request. Prepared By: Market Intelligence Agent. Ensure all template sections are addressed or marked 'N/A' if data is missing. No ```markdown``` fences."),
+        ("human", "Template:\n{template_content}\n\nData (JSON):\n{json_report_data}\n\nChart Filenames (comma-separated):\n{csv_chart_filenames}\n\nMarket: {market_domain}\nDate: {report_date}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.1) | StrOutputParser()
+
+@functools.lru_cache(maxsize=1)
+def get_report_from_scratch_chain():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Generate a comprehensive markdown report for the market and query given in the request. Include sections: Executive Summary, Key Market Trends, Identified Opportunities, Strategic Recommendations, Competitive Landscape, and Visualizations. Refer to charts by filename (e.g., ![Chart Description](chart_filename.png)). Use the date given in the request. Prepared By: Market Intelligence Agent. No ```markdown``` fences."),
+        ("human", "Data (JSON):\n{json_report_data}\n\nChart Filenames (comma-separated):\n{csv_chart_filenames}\n\nMarket: {market_domain}\nQuery: {query}\nDate: {report_date}")
+    ])
+    return prompt | get_chat_model("gemini-pro", 0.1) | StrOutputParser()
+
+# Everything the nodes after market_data_collector produce. The collector persists the full state once;
+# the final report node persists these in one transaction. Mid-run recovery goes through the workflow checkpointer.
+WORKFLOW_OUTPUT_FIELDS = ("market_trends", "opportunities", "strategic_recommendations", "report_template", "vector_store_path", "query_response", "report_dir", "chart_paths", "report_generated_ok")
+
+def write_report_files(report_path: str, report_markdown: str, main_log_path: str, log_copy_path: str) -> bool:
+    # The report node's blocking file work, run as one worker-thread hop instead of stalling the event loop per file
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report_markdown)
+    logger.info(f"Report Generation: Report saved to {report_path}")
+    report_ok = verify_report_file(report_path)
+    if os.path.exists(main_log_path):
+        shutil.copy2(main_log_path, log_copy_path)
+    else:
+        logger.warning(f"Main log file not found at {main_log_path} for copying to report dir.")
+    return report_ok
+
 async def generate_market_intelligence_report(current_state: MarketIntelligenceState) -> Dict[str, Any]:
     logger.info(f"Report Generation: Domain='{current_state.market_domain}', StateID='{current_state.state_id}'")
-    if not current_state.report_dir or not os.path.isdir(current_state.report_dir):
+    if not current_state.report_dir or not is_known_dir(current_state.report_dir):
         error_logger.critical(f"CRITICAL: report_dir '{current_state.report_dir}' is invalid.")
         base_reports_dir = get_agent_base_reports_dir()
         ts_fb = datetime.now().strftime("%Y%m%d_%H%M%S")
-        query_fb = re.sub(r'[^a-zA-Z0-9_-]', '_', (current_state.query or "report_error").lower().replace(' ', '_')[:10])
+        query_fb = _SLUG_RE.sub('_', (current_state.query or "report_error").lower().replace(' ', '_')[:10])
         current_state.report_dir = os.path.join(base_reports_dir, f"{query_fb}_{ts_fb}_REPORT_ERROR_DIR")
-        os.makedirs(current_state.report_dir, exist_ok=True)
-        error_logger.warning(f"Created emergency fallback report_dir: {current_state.report_dir}")
+        ensure_dir(current_state.report_dir)
+        error_logger.warning("Created emergency fallback report_dir: %s", current_state.report_dir)
 
     current_state.market_trends = current_state.market_trends or []
     current_state.opportunities = current_state.opportunities or []
@@ -990,13 +2118,13 @@ async def generate_market_intelligence_report(current_state: MarketIntelligenceS
         "market_trends": current_state.market_trends,
         "opportunities": current_state.opportunities,
         "strategic_recommendations": current_state.strategic_recommendations,
-        "competitor_data_sample": current_state.competitor_data[:5],
-        "news_data_sample": current_state.raw_news_data[:5]
+        "competitor_data_sample": await asyncio.to_thread(resolve_page_contents, competitor_prompt_sample(current_state, current_state.raw_news_data[:PROMPT_SAMPLE_SIZE])),
+        "news_data_sample": await asyncio.to_thread(resolve_page_contents, current_state.raw_news_data[:PROMPT_SAMPLE_SIZE])
     }
 
     output_directory_path = current_state.report_dir
     timestamp_report_gen = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    report_filename_md = f"{current_state.market_domain.lower().replace(' ', '_')}_report_{current_state.state_id[:4]}.md"
+    report_filename_md = current_state.report_basename
     report_full_path_md = os.path.join(output_directory_path, report_filename_md)
 
     agent_script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -1013,29 +2141,25 @@ async def generate_market_intelligence_report(current_state: MarketIntelligenceS
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Report Generation (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set.")
-        llm_report = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.1)
         if current_state.report_template:
             logger.info("Report Generation: Using existing template.")
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", f"Fill the markdown template with provided data for {current_state.market_domain}. Refer to charts using their filenames (e.g., ![Chart Description](chart_filename.png)). Date: {timestamp_report_gen}. Prepared By: Market Intelligence Agent. Ensure all template sections are addressed or marked 'N/A' if data is missing. No ```markdown``` fences."),
-                ("human", "Template:\n{template_content}\n\nData (JSON):\n{json_report_data}\n\nChart Filenames (comma-separated):\n{csv_chart_filenames}")
-            ])
-            chain = prompt | llm_report | StrOutputParser()
+            chain = get_report_from_template_chain()
             final_generated_markdown = await chain.ainvoke({ # Use ainvoke
                 "template_content": current_state.report_template,
-                "json_report_data": json.dumps(report_data_for_llm),
-                "csv_chart_filenames": ", ".join(current_state.chart_paths or [])
+                "json_report_data": prompt_json_dumps(report_data_for_llm),
+                "csv_chart_filenames": ", ".join(current_state.chart_paths or []),
+                "market_domain": current_state.market_domain,
+                "report_date": timestamp_report_gen
             })
         else:
             logger.warning("Report Generation: No template found, generating from scratch.")
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", f"Generate a comprehensive markdown report for {current_state.market_domain} based on the query '{current_state.query or 'general analysis'}'. Include sections: Executive Summary, Key Market Trends, Identified Opportunities, Strategic Recommendations, Competitive Landscape, and Visualizations. Refer to charts by filename (e.g., ![Chart Description](chart_filename.png)). Date: {timestamp_report_gen}. Prepared By: Market Intelligence Agent. No ```markdown``` fences."),
-                ("human", "Data (JSON):\n{json_report_data}\n\nChart Filenames (comma-separated):\n{csv_chart_filenames}")
-            ])
-            chain = prompt | llm_report | StrOutputParser()
+            chain = get_report_from_scratch_chain()
             final_generated_markdown = await chain.ainvoke({ # Use ainvoke
-                "json_report_data": json.dumps(report_data_for_llm),
-                "csv_chart_filenames": ", ".join(current_state.chart_paths or [])
+                "json_report_data": prompt_json_dumps(report_data_for_llm),
+                "csv_chart_filenames": ", ".join(current_state.chart_paths or []),
+                "market_domain": current_state.market_domain,
+                "query": current_state.query or "general analysis",
+                "report_date": timestamp_report_gen
             })
 
         final_generated_markdown = final_generated_markdown.replace("```markdown", "").replace("```", "").strip()
@@ -1044,31 +2168,48 @@ async def generate_market_intelligence_report(current_state: MarketIntelligenceS
             chart_refs_str = "\n".join([f"![{fn}]({fn})" for fn in (current_state.chart_paths or [])])
             final_generated_markdown = f"# Fallback Report: {current_state.market_domain}\n\nLLM failed to generate content.\nCharts:\n{chart_refs_str}"
 
-        with open(report_full_path_md, "w", encoding="utf-8") as f:
-            f.write(final_generated_markdown)
-        logger.info(f"Report Generation: Report saved to {report_full_path_md}")
-        verify_report_file(report_full_path_md)
+        current_state.report_generated_ok = await asyncio.to_thread(write_report_files, report_full_path_md, final_generated_markdown, main_exec_log_path, log_file_copy_path)
 
-        if os.path.exists(main_exec_log_path):
-            shutil.copy2(main_exec_log_path, log_file_copy_path)
-        else:
-            logger.warning(f"Main log file not found at {main_exec_log_path} for copying to report dir.")
-
-        generate_readme(current_state, output_directory_path, report_filename_md)
+        await wait_for_vector_store_build(current_state)
+        await asyncio.to_thread(generate_readme, current_state, output_directory_path, report_filename_md)
 
     except Exception as e_report_final:
+        raise_if_resumable(e_report_final)
         error_logger.error(f"Report Generation: Main process failed: {e_report_final}\n{traceback.format_exc()}")
         try:
-            with open(report_full_path_md, "w", encoding="utf-8") as f_err:
+            with open(report_full_path_md, "w", encoding="utf-8", buffering=ERROR_REPORT_BUFFER_BYTES) as f_err:
                 f_err.write(f"# REPORT GENERATION ERROR\n\n{str(e_report_final)}\n\n{traceback.format_exc()}")
         except Exception as e_report_write_err:
             error_logger.error(f"Failed to write error report: {e_report_write_err}")
 
-    save_state(current_state)
+    await wait_for_vector_store_build(current_state)
+    save_state(current_state, changed_fields=WORKFLOW_OUTPUT_FIELDS)
     logger.info("Report Generation: Node completed.")
-    return current_state.model_dump()
+    return {"report_dir": current_state.report_dir, "chart_paths": current_state.chart_paths, "report_generated_ok": current_state.report_generated_ok, "vector_store_path": current_state.vector_store_path}
 
-def create_market_intelligence_workflow() -> StateGraph:
+# In-process checkpoints keyed by state_id; they only need to outlive a single run so a failed run can resume
+@functools.lru_cache(maxsize=1)
+def get_workflow_checkpointer():
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
+
+def release_workflow_checkpoints(thread_id: str):
+    try:
+        get_workflow_checkpointer().delete_thread(thread_id)
+    except Exception as e_release:
+        error_logger.error(f"Failed to release workflow checkpoints for {thread_id}: {e_release}")
+
+def should_run_rag(state: MarketIntelligenceState) -> str:
+    if state.question and state.vector_store_path:
+        logger.info("Conditional Edge: Question and vector store present, proceeding to RAG query.")
+        return "rag_query"
+    logger.info("Conditional Edge: No question or vector store, skipping RAG query, proceeding to report generation.")
+    return "generate_final_report"
+
+# The graph topology is static, so it is built and compiled once per process
+@locked_singleton
+def create_market_intelligence_workflow() -> "StateGraph":
+    from langgraph.graph import StateGraph, END
     workflow_instance = StateGraph(MarketIntelligenceState)
     workflow_instance.add_node("market_data_collector", market_data_collector)
     workflow_instance.add_node("trend_analyzer", trend_analyzer)
@@ -1079,17 +2220,13 @@ def create_market_intelligence_workflow() -> StateGraph:
     workflow_instance.add_node("rag_query", rag_query)
     workflow_instance.add_node("generate_final_report", generate_market_intelligence_report)
     workflow_instance.set_entry_point("market_data_collector")
+    # The template only needs domain + query, so it runs alongside the trend -> opportunity -> strategy chain.
+    # Parallel nodes return just the keys they own; LangGraph rejects two writes to one key in the same step.
     workflow_instance.add_edge("market_data_collector", "trend_analyzer")
+    workflow_instance.add_edge("market_data_collector", "report_template_generator")
     workflow_instance.add_edge("trend_analyzer", "opportunity_identifier")
     workflow_instance.add_edge("opportunity_identifier", "strategy_recommender")
-    workflow_instance.add_edge("strategy_recommender", "report_template_generator")
-    workflow_instance.add_edge("report_template_generator", "setup_vector_store")
-    def should_run_rag(state: MarketIntelligenceState) -> str:
-        if state.question and state.vector_store_path:
-            logger.info("Conditional Edge: Question and vector store present, proceeding to RAG query.")
-            return "rag_query"
-        logger.info("Conditional Edge: No question or vector store, skipping RAG query, proceeding to report generation.")
-        return "generate_final_report"
+    workflow_instance.add_edge(["strategy_recommender", "report_template_generator"], "setup_vector_store")
     workflow_instance.add_conditional_edges(
         "setup_vector_store",
         should_run_rag,
@@ -1098,7 +2235,30 @@ def create_market_intelligence_workflow() -> StateGraph:
     workflow_instance.add_edge("rag_query", "generate_final_report")
     workflow_instance.add_edge("generate_final_report", END)
     logger.info("Market intelligence workflow compiled.")
-    return workflow_instance.compile()
+    return workflow_instance.compile(checkpointer=get_workflow_checkpointer())
+
+# Only successful probes are remembered, so a directory that becomes writable later is picked up on the next run
+_writable_reports_dirs = set()
+
+def verify_reports_dir_writable(reports_dir: str) -> Optional[str]:
+    if reports_dir in _writable_reports_dirs:
+        return None
+    try:
+        temp_perm_test_file = os.path.join(reports_dir, f".perm_{uuid4()}.tmp")
+        probe_fd = os.open(temp_perm_test_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.write(probe_fd, b"ok")
+        finally:
+            os.close(probe_fd)
+            os.unlink(temp_perm_test_file)
+    except Exception as e_base_dir_perm:
+        return str(e_base_dir_perm)
+    _writable_reports_dirs.add(reports_dir)
+    return None
+
+def agent_run_cache_key(query_str: str, market_domain_str: str, question_str: Optional[str]) -> str:
+    env_fingerprint = hashlib.blake2b("\x1f".join(os.getenv(var, "") for var in AGENT_RUN_CACHE_ENV_VARS).encode("utf-8"), digest_size=8).hexdigest()
+    return "\x1f".join((_cache_key(query_str), _cache_key(market_domain_str), _cache_key(question_str or ""), env_fingerprint))
 
 async def run_market_intelligence_agent(query_str: str = "Market analysis", market_domain_str: str = "Technology", question_str: Optional[str] = None) -> Dict[str, Any]:
     run_start_ts = datetime.now()
@@ -1115,14 +2275,17 @@ async def run_market_intelligence_agent(query_str: str = "Market analysis", mark
             "rag_log_filename": None, "vector_store_dirname": None, "query_response": None
         }
 
+    run_cache_key = agent_run_cache_key(query_str, market_domain_str, question_str)
+    cached_run = cache_get(agent_run_cache, run_cache_key)
+    # On Vercel /tmp can be recycled between requests; only serve a cached run whose report files still exist
+    if cached_run is not None and os.path.isdir(cached_run["report_dir"]):
+        logger.info(f"Agent Run: Cache hit for Query='{query_str}', Domain='{market_domain_str}'. Reusing State ID: {cached_run['response']['state_id']}")
+        return copy.deepcopy(cached_run["response"])
+
     agent_base_reports_dir = get_agent_base_reports_dir()
-    try:
-        temp_perm_test_file = os.path.join(agent_base_reports_dir, f".perm_{uuid4()}.tmp")
-        with open(temp_perm_test_file, "w") as f:
-            f.write("ok")
-        os.remove(temp_perm_test_file)
-    except Exception as e_base_dir_perm:
-        msg = f"CRITICAL: No write permission to base reports directory '{agent_base_reports_dir}'. Error: {e_base_dir_perm}"
+    base_dir_perm_error = verify_reports_dir_writable(agent_base_reports_dir)
+    if base_dir_perm_error:
+        msg = f"CRITICAL: No write permission to base reports directory '{agent_base_reports_dir}'. Error: {base_dir_perm_error}"
         error_logger.critical(msg)
         return {
             "success": False, "error": msg, "state_id": None, "report_dir_relative": None,
@@ -1137,26 +2300,44 @@ async def run_market_intelligence_agent(query_str: str = "Market analysis", mark
     try:
         logger.info(f"Agent Run: Invoking workflow. State ID: {current_run_initial_state.state_id}")
         # Assuming compiled_agent_workflow has an ainvoke method for async execution
-        final_run_state_dict = await compiled_agent_workflow.ainvoke(current_run_initial_state)
-        final_run_state = MarketIntelligenceState(**final_run_state_dict)
+        workflow_run_config = {"configurable": {"thread_id": current_run_initial_state.state_id}}
+        try:
+            try:
+                final_run_state_dict = await compiled_agent_workflow.ainvoke(current_run_initial_state, config=workflow_run_config)
+            except TRANSIENT_WORKFLOW_ERRORS as e_first_attempt:
+                # Nodes that already completed are checkpointed; resuming re-runs only the failed step onwards
+                error_logger.error(f"Agent Run: Workflow failed ({e_first_attempt}); resuming State ID {current_run_initial_state.state_id} from its last checkpoint.")
+                resuming_token = _workflow_resuming.set(True)
+                try:
+                    final_run_state_dict = await compiled_agent_workflow.ainvoke(None, config=workflow_run_config)
+                finally:
+                    _workflow_resuming.reset(resuming_token)
+        finally:
+            close_rag_log(current_run_initial_state.state_id)
+            release_workflow_checkpoints(current_run_initial_state.state_id)
+        # LangGraph already validated every field on the way through the nodes
+        final_run_state = MarketIntelligenceState.model_construct(**final_run_state_dict)
         logger.info(f"Agent Run: Workflow completed. Final State ID: {final_run_state.state_id}")
 
-        if not final_run_state.report_dir or not os.path.isdir(final_run_state.report_dir):
+        # The report node already verified its own file; only re-check when it did not, or when the directory is replaced below
+        report_verified_by_node = final_run_state.report_generated_ok
+        if not final_run_state.report_dir or not is_known_dir(final_run_state.report_dir):
+            report_verified_by_node = False
             error_logger.critical(f"Agent Run: CRITICAL - report_dir is invalid ('{final_run_state.report_dir}') after workflow.")
             fallback_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            fallback_query = re.sub(r'[^a-zA-Z0-9_-]', '_', (query_str or "agent_run_error").lower().replace(' ', '_')[:10])
+            fallback_query = _SLUG_RE.sub('_', (query_str or "agent_run_error").lower().replace(' ', '_')[:10])
             final_run_state.report_dir = os.path.join(agent_base_reports_dir, f"{fallback_query}_{fallback_ts}_FINAL_RUN_ERROR_DIR")
-            os.makedirs(final_run_state.report_dir, exist_ok=True)
+            ensure_dir(final_run_state.report_dir)
             try:
                 error_readme_content = f"# Agent Run Error..."
-                with open(os.path.join(final_run_state.report_dir, "README_ERROR.md"), "w") as f_err_readme:
+                with open(os.path.join(final_run_state.report_dir, "README_ERROR.md"), "w", encoding="utf-8", buffering=ERROR_REPORT_BUFFER_BYTES) as f_err_readme:
                     f_err_readme.write(error_readme_content)
             except:
                 pass
 
         output_directory_path = final_run_state.report_dir
-        report_md_file_path = os.path.join(output_directory_path, f"{final_run_state.market_domain.lower().replace(' ', '_')}_report_{final_run_state.state_id[:4]}.md")
-        is_final_report_valid = verify_report_file(report_md_file_path)
+        report_md_file_path = os.path.join(output_directory_path, final_run_state.report_basename)
+        is_final_report_valid = report_verified_by_node or verify_report_file(report_md_file_path)
         report_dir_for_client = output_directory_path
         if output_directory_path.startswith("/tmp/"):
             report_dir_for_client = os.path.relpath(output_directory_path, "/tmp")
@@ -1165,33 +2346,34 @@ async def run_market_intelligence_agent(query_str: str = "Market analysis", mark
             "state_id": final_run_state.state_id,
             "query_response": final_run_state.query_response,
             "report_dir_relative": report_dir_for_client,
-            "report_filename": os.path.basename(report_md_file_path) if is_final_report_valid else None,
+            "report_filename": final_run_state.report_basename if is_final_report_valid else None,
             "chart_filenames": final_run_state.chart_paths or [],
-            "data_json_filename": f"{final_run_state.market_domain.lower().replace(' ', '_')}_data_sources.json",
-            "data_csv_filename": f"{final_run_state.market_domain.lower().replace(' ', '_')}_data_sources.csv",
+            "data_json_filename": final_run_state.data_json_basename,
+            "data_csv_filename": final_run_state.data_csv_basename,
             "readme_filename": "README.md",
             "log_filename": "market_intelligence_run.log",
-            "rag_log_filename": f"rag_responses_{final_run_state.state_id[:4]}.log",
-            "vector_store_dirname": os.path.basename(final_run_state.vector_store_path) if final_run_state.vector_store_path else None,
+            "rag_log_filename": final_run_state.rag_log_basename,
+            "vector_store_dirname": final_run_state.vector_store_dirname,
         }
         if not is_final_report_valid:
             error_msg_report = f"Critical: Main report Markdown file not found or invalid at '{report_md_file_path}'."
             response_object["error"] = (response_object.get("error", "") + " " + error_msg_report).strip()
             error_logger.error(error_msg_report)
+        if response_object["success"]:
+            cache_put(agent_run_cache, run_cache_key, {"report_dir": output_directory_path, "response": copy.deepcopy(response_object)})
         logger.info(f"Agent Run: Finished. Success: {response_object['success']}. Report relative dir: {response_object['report_dir_relative']}")
         return response_object
     except Exception as e_agent_run:
-        tb_str = traceback.format_exc()
+        tb_str = "".join(traceback.format_exception(type(e_agent_run), e_agent_run, e_agent_run.__traceback__, limit=-CRITICAL_TRACEBACK_FRAME_LIMIT))
         error_logger.critical(f"Agent Run: CRITICAL FAILURE during workflow execution. Query='{query_str}', Domain='{market_domain_str}'. Error: {e_agent_run}\n{tb_str}")
         error_state_id = current_run_initial_state.state_id
-        agent_base_reports_dir_err = get_agent_base_reports_dir()
-        error_report_dir_path = os.path.join(agent_base_reports_dir_err, f"CRITICAL_ERROR_{error_state_id[:8]}_{datetime.now().strftime('%Y%m%d%H%M%S')}")
+        error_report_dir_path = os.path.join(agent_base_reports_dir, f"CRITICAL_ERROR_{error_state_id[:8]}_{datetime.now().strftime('%Y%m%d%H%M%S')}")
         error_report_file_path = None
         try:
-            os.makedirs(error_report_dir_path, exist_ok=True)
+            ensure_dir(error_report_dir_path)
             error_report_filename_val = f"AGENT_WORKFLOW_ERROR_{error_state_id[:4]}.md"
             error_report_file_path = os.path.join(error_report_dir_path, error_report_filename_val)
-            with open(error_report_file_path, "w", encoding="utf-8") as f_crit_report:
+            with open(error_report_file_path, "w", encoding="utf-8", buffering=ERROR_REPORT_BUFFER_BYTES) as f_crit_report:
                 f_crit_report.write(f"# Agent Workflow Critical Error\n\nTimestamp: {run_start_ts.isoformat()}\nQuery: {query_str}\nDomain: {market_domain_str}\nState ID: {error_state_id}\n\nError: {str(e_agent_run)}\n\nTraceback:\n```\n{tb_str}\n```")
         except Exception as e_emergency_dir_write:
             error_logger.critical(f"Agent Run: FAILED TO WRITE EMERGENCY ERROR REPORT to '{error_report_dir_path}': {e_emergency_dir_write}")
@@ -1209,37 +2391,171 @@ async def run_market_intelligence_agent(query_str: str = "Market analysis", mark
             "query_response": None
         }
 
-async def chat_with_agent(message: str, session_id: str, history: List[Dict[str, Any]]) -> str:
+CHAT_MESSAGE_TYPES = {"user": HumanMessage, "ai": AIMessage}
+
+@locked_singleton
+def get_chat_chain():
+    prompt_template = ChatPromptTemplate.from_messages([
+        ("system", "You are a helpful assistant. Respond to the user's query based on the provided chat history."),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}")
+    ])
+    return prompt_template | get_chat_model("gemini-pro", 0.7) | StrOutputParser()
+
+# Background analysis runs; the task set keeps a strong reference until each run finishes
+_analysis_job_tasks = set()
+# Full pipelines running at once per process; further jobs stay "queued" until a slot frees up
+ANALYSIS_JOB_CONCURRENCY = int(os.getenv("ANALYSIS_JOB_CONCURRENCY", "2"))
+_analysis_job_semaphore: Optional[asyncio.Semaphore] = None
+_analysis_job_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_analysis_job_semaphore() -> asyncio.Semaphore:
+    # Created on the serving loop; on Python 3.9 a semaphore binds to whichever loop exists when it is constructed
+    global _analysis_job_semaphore, _analysis_job_semaphore_loop
+    running_loop = asyncio.get_running_loop()
+    if _analysis_job_semaphore is None or _analysis_job_semaphore_loop is not running_loop:
+        _analysis_job_semaphore = asyncio.Semaphore(ANALYSIS_JOB_CONCURRENCY)
+        _analysis_job_semaphore_loop = running_loop
+    return _analysis_job_semaphore
+
+async def run_analysis_job(job_id_val: str, query_str: str, market_domain_str: str, question_str: Optional[str]):
+    async with get_analysis_job_semaphore():
+        await asyncio.to_thread(save_analysis_job, job_id_val, "running")
+        try:
+            job_result = await run_market_intelligence_agent(query_str=query_str, market_domain_str=market_domain_str, question_str=question_str)
+            await asyncio.to_thread(save_analysis_job, job_id_val, "completed" if job_result.get("success") else "failed", job_result)
+        except Exception as e_job:
+            error_logger.error(f"Analysis job {job_id_val} failed: {e_job}\n{traceback.format_exc()}")
+            await asyncio.to_thread(save_analysis_job, job_id_val, "failed", {"success": False, "error": f"Error during market analysis: {e_job}"})
+
+async def start_analysis_job(query_str: str, market_domain_str: str, question_str: Optional[str] = None) -> str:
+    job_id_val = str(uuid4())
+    await asyncio.to_thread(save_analysis_job, job_id_val, "queued")
+    job_task = asyncio.create_task(run_analysis_job(job_id_val, query_str, market_domain_str, question_str))
+    _analysis_job_tasks.add(job_task)
+    job_task.add_done_callback(_analysis_job_tasks.discard)
+    logger.info(f"Analysis job {job_id_val} queued: Query='{query_str}', Domain='{market_domain_str}'")
+    return job_id_val
+
+# Paraphrased repeats of a question within one session, asked against the same chat history, are answered from the
+# cache instead of the LLM. Off by default: it loads the embedding model, which a /chat-only process otherwise never imports.
+CHAT_SEMANTIC_CACHE_ENABLED = os.getenv("CHAT_SEMANTIC_CACHE", "0") == "1"
+CHAT_SEMANTIC_CACHE_MIN_SIMILARITY = 0.92
+
+def chat_history_digest(history: List[Dict[str, Any]]) -> str:
+    # Follow-ups like "why?" mean different things after different answers, so cached answers are tied to the history
+    return hashlib.blake2b(orjson.dumps([(msg_data["type"], msg_data["content"]) for msg_data in history]), digest_size=16).hexdigest()
+
+def lookup_chat_response_cache(session_id_val: str, message_val: str, context_digest: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+    try:
+        message_vector = np.asarray(get_query_embeddings().embed_query(message_val), dtype=np.float32)
+        vector_norm = np.linalg.norm(message_vector)
+        if vector_norm:
+            message_vector /= vector_norm
+        cached_rows = _get_conn().execute(
+            'SELECT answer, embedding FROM chat_response_cache WHERE session_id = ? AND created_at > ? AND context_digest = ?',
+            (session_id_val, time.time() - CHAT_SEMANTIC_CACHE_TTL_SECONDS, context_digest)
+        ).fetchall()
+        if not cached_rows:
+            return None, message_vector
+        similarities = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in cached_rows]) @ message_vector
+        best_idx = int(np.argmax(similarities))
+        if similarities[best_idx] >= CHAT_SEMANTIC_CACHE_MIN_SIMILARITY:
+            logger.info(f"Agent Chat: Semantic cache hit for session_id {session_id_val} (similarity {similarities[best_idx]:.3f}).")
+            return cached_rows[best_idx][0], message_vector
+        return None, message_vector
+    except Exception as e_chat_cache:
+        error_logger.error(f"Chat semantic cache lookup failed for session {session_id_val}: {e_chat_cache}")
+        return None, None
+
+def save_chat_response_cache(session_id_val: str, message_val: str, message_vector: np.ndarray, answer_val: str, context_digest: str):
+    now_ts = time.time()
+    try:
+        conn = _get_conn()
+        with conn:
+            # Expired entries of this session go on every write (a primary-key range); prune_cache_tables sweeps the rest
+            conn.execute('DELETE FROM chat_response_cache WHERE session_id = ? AND created_at < ?', (session_id_val, now_ts - CHAT_SEMANTIC_CACHE_TTL_SECONDS))
+            conn.execute(
+                'INSERT OR REPLACE INTO chat_response_cache (session_id, created_at, question, answer, embedding, context_digest) VALUES (?, ?, ?, ?, ?, ?)',
+                (session_id_val, now_ts, message_val, answer_val, message_vector.astype(np.float32).tobytes(), context_digest)
+            )
+    except Exception as e_chat_cache:
+        error_logger.error(f"Failed to cache chat response for session {session_id_val}: {e_chat_cache}")
+
+async def chat_with_agent(message: str, session_id: str, history: List[Dict[str, Any]], use_cache: bool = True) -> str:
     logger.info(f"Agent Chat: Received message for session_id {session_id}: '{message}'")
-    save_chat_message(session_id, "user", message)
-    langchain_history = []
-    for msg_data in history:
-        if msg_data["type"] == "user":
-            langchain_history.append(HumanMessage(content=msg_data["content"]))
-        elif msg_data["type"] == "ai":
-            langchain_history.append(AIMessage(content=msg_data["content"]))
+    message_vector = None
+    context_digest = chat_history_digest(history) if use_cache and CHAT_SEMANTIC_CACHE_ENABLED else None
+    if context_digest is not None:
+        cached_response, message_vector = await asyncio.to_thread(lookup_chat_response_cache, session_id, message, context_digest)
+        if cached_response is not None:
+            await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", cached_response)])
+            return cached_response
+    langchain_history = [CHAT_MESSAGE_TYPES[msg_data["type"]](content=msg_data["content"]) for msg_data in history if msg_data["type"] in CHAT_MESSAGE_TYPES]
     try:
         if not os.getenv("GOOGLE_API_KEY"):
             error_logger.critical("GOOGLE_API_KEY not found for Chat (Gemini).")
             raise ValueError("GOOGLE_API_KEY is not set for chat.")
-        chat_llm = init_chat_model(model_name="gemini-pro", model_provider="google_genai", temperature=0.7)
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", "You are a helpful assistant. Respond to the user's query based on the provided chat history."),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}")
-        ])
-        chain = prompt_template | chat_llm | StrOutputParser()
+        chain = get_chat_chain()
         # Assuming chain has an ainvoke method for async execution
         response_text = await chain.ainvoke({"input": message, "chat_history": langchain_history})
-        save_chat_message(session_id, "ai", response_text)
+        await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", response_text)])
+        if message_vector is not None and response_text:
+            await asyncio.to_thread(save_chat_response_cache, session_id, message, message_vector, response_text, context_digest)
         logger.info(f"Agent Chat: Response generated for session_id {session_id}.")
         return response_text
     except Exception as e:
         error_logger.error(f"Agent Chat: Error processing message for session {session_id}: {e}\n{traceback.format_exc()}")
         error_response = "Sorry, I encountered an error while processing your message."
-        save_chat_message(session_id, "ai", error_response)
+        await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", error_response)])
         return error_response
 
+async def chat_with_agent_stream(message: str, session_id: str, history: List[Dict[str, Any]], use_cache: bool = True) -> AsyncIterator[str]:
+    logger.info(f"Agent Chat Stream: Received message for session_id {session_id}: '{message}'")
+    message_vector = None
+    context_digest = chat_history_digest(history) if use_cache and CHAT_SEMANTIC_CACHE_ENABLED else None
+    if context_digest is not None:
+        cached_response, message_vector = await asyncio.to_thread(lookup_chat_response_cache, session_id, message, context_digest)
+        if cached_response is not None:
+            await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", cached_response)])
+            yield cached_response
+            return
+    langchain_history = [CHAT_MESSAGE_TYPES[msg_data["type"]](content=msg_data["content"]) for msg_data in history if msg_data["type"] in CHAT_MESSAGE_TYPES]
+    response_chunks = []
+    try:
+        if not os.getenv("GOOGLE_API_KEY"):
+            error_logger.critical("GOOGLE_API_KEY not found for Chat (Gemini).")
+            raise ValueError("GOOGLE_API_KEY is not set for chat.")
+        async for response_chunk in get_chat_chain().astream({"input": message, "chat_history": langchain_history}):
+            response_chunks.append(response_chunk)
+            yield response_chunk
+        # The exchange is persisted once, after the last chunk, exactly as the non-streaming path stores it
+        await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", "".join(response_chunks))])
+        if message_vector is not None and response_chunks:
+            await asyncio.to_thread(save_chat_response_cache, session_id, message, message_vector, "".join(response_chunks), context_digest)
+        logger.info(f"Agent Chat Stream: Response streamed for session_id {session_id}.")
+    except Exception as e:
+        error_logger.error(f"Agent Chat Stream: Error processing message for session {session_id}: {e}\n{traceback.format_exc()}")
+        error_response = "Sorry, I encountered an error while processing your message."
+        await asyncio.to_thread(save_chat_messages, session_id, [("user", message), ("ai", "".join(response_chunks) or error_response)])
+        if not response_chunks:
+            yield error_response
+
+def prewarm_agent():
+    # Builds the lazily created singletons so the first request after a cold start finds them ready
+    try:
+        create_market_intelligence_workflow()
+        if os.getenv("GOOGLE_API_KEY"):
+            get_chat_chain()
+        if CHAT_SEMANTIC_CACHE_ENABLED:
+            get_query_embeddings()
+        logger.info("Agent prewarm: workflow and chat chain ready.")
+    except Exception as e_prewarm:
+        error_logger.error(f"Agent prewarm failed: {e_prewarm}")
+
+if os.getenv("AGENT_PREWARM", "1") == "1":
+    threading.Thread(target=prewarm_agent, name="agent-prewarm", daemon=True).start()
+
 if __name__ == "__main__":
     cmd_arg_parser = argparse.ArgumentParser(description="Market Intelligence Agent CLI")
     cmd_arg_parser.add_argument("--query", type=str, default="AI impact on EdTech", help="The main query or topic for market analysis.")
@@ -1249,9 +2565,6 @@ if __name__ == "__main__":
     parsed_cli_args = cmd_arg_parser.parse_args()
 
     logger.info(f"Agent CLI: Starting with Query='{parsed_cli_args.query}', Market='{parsed_cli_args.market}', Question='{parsed_cli_args.question or 'N/A'}'")
-    # Note: This local CLI runner will need to be adapted to run an async function,
-    # e.g., using asyncio.run()
-    import asyncio
     cli_run_output = asyncio.run(run_market_intelligence_agent(
         query_str=parsed_cli_args.query,
         market_domain_str=parsed_cli_args.market,
@@ -1,16 +1,25 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 import structlog
-from pydantic_settings import BaseSettings
+import orjson
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from functools import lru_cache
+import asyncio
+import logging
 import re
 import os
 from agent_logic import (
     chat_with_agent,
+    chat_with_agent_stream,
+    close_http_client,
+    get_http_client,
     load_chat_history,
     init_db as init_agent_db,
-    run_market_intelligence_agent
+    load_analysis_job,
+    run_market_intelligence_agent,
+    start_analysis_job
 )
 
 # Environment variable configuration
@@ -36,17 +45,25 @@ class Settings(BaseSettings):
     EMAIL_SERVICE_API_KEY: str
     EMAIL_FROM: str
 
-    class Config:
-        env_file = "../.env.local"
-        env_file_encoding = "utf-8"
+    model_config = SettingsConfigDict(env_file="../.env.local", env_file_encoding="utf-8", frozen=True, extra="ignore")
+
+# The env file is parsed once per process; later callers share the same frozen instance
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
 
 # Initialize settings and logger
 try:
-    settings = Settings()
+    settings = get_settings()
 except Exception as e:
     print(f"Failed to load environment variables: {str(e)}")
     exit(1)
 
+# Calls below LOG_LEVEL (default: the root level set up by agent_logic) return before any processor runs
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "").upper(), None)
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.getLogger().getEffectiveLevel()
+
 structlog.configure(
     processors=[
         structlog.processors.TimeStamper(fmt="iso"),
@@ -55,7 +72,7 @@ structlog.configure(
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    wrapper_class=structlog.make_filtering_bound_logger(LOG_LEVEL),
     cache_logger_on_first_use=True,
 )
 logger = structlog.get_logger()
@@ -63,6 +80,8 @@ logger = structlog.get_logger()
 # Set default USER_AGENT
 os.environ.setdefault("USER_AGENT", "MarketIntelligenceAgent/1.0 (+http://example.com/botinfo)")
 
+SESSION_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{1,50}\Z')
+
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str = Field(min_length=1, description="User's message to the agent")
@@ -71,7 +90,7 @@ class ChatRequest(BaseModel):
     @field_validator('session_id')
     @classmethod
     def validate_session_id(cls, v: str) -> str:
-        if not re.match(r'^[a-zA-Z0-9_-]{1,50}$', v):
+        if not SESSION_ID_PATTERN.match(v):
             raise ValueError("Session ID must contain only letters, numbers, underscores, or hyphens")
         return v
 
@@ -99,6 +118,11 @@ class RunAnalysisResponse(BaseModel):
     vector_store_dirname: Optional[str] = None
     error: Optional[str] = None
 
+class AnalysisJobResponse(BaseModel):
+    job_id: str
+    status: str
+    result: Optional[RunAnalysisResponse] = None
+
 app = FastAPI(
     title="Market Intelligence Agent API",
     description="API for interacting with the RAG Agent using ChromaDB",
@@ -117,24 +141,31 @@ async def global_exception_handler(request: Request, exc: Exception):
 async def startup_event():
     logger.info("FastAPI app startup: Initializing agent database")
     try:
-        init_agent_db()
+        await asyncio.to_thread(init_agent_db)
         logger.info("Agent database initialization complete")
     except Exception as e:
         logger.error("Failed to initialize database", exc_info=e)
         raise
+    # Model clients and chains are prewarmed on import; the pooled HTTP client needs the server's event loop
+    get_http_client()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_client()
 
 @app.post("/chat", response_model=ChatResponse)
-async def handle_chat(request: ChatRequest):
+async def handle_chat(request: ChatRequest, http_request: Request):
     logger.info("Received chat request", session_id=request.session_id)
     try:
         if not request.message.strip():
             logger.warning("Empty message received", session_id=request.session_id)
             raise HTTPException(status_code=400, detail="Message cannot be empty")
-        history = load_chat_history(request.session_id)
+        history = await asyncio.to_thread(load_chat_history, request.session_id)
         agent_response_text = await chat_with_agent(
             message=request.message,
             session_id=request.session_id,
-            history=history
+            history=history,
+            use_cache="x-no-cache" not in http_request.headers
         )
         if not agent_response_text:
             logger.error("Agent returned empty response", session_id=request.session_id)
@@ -156,7 +187,34 @@ async def handle_chat(request: ChatRequest):
         logger.error("Chat endpoint error", session_id=request.session_id, exc_info=e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.post("/run-analysis", response_model=RunAnalysisResponse)
+async def sse_events(text_chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    # Frames each streamed chunk as a Server-Sent Event, then marks the end of the answer
+    async for text_chunk in text_chunks:
+        yield b"data: " + orjson.dumps({"text": text_chunk}) + b"\n\n"
+    yield b"event: done\ndata: {}\n\n"
+
+@app.post("/chat/stream")
+async def handle_chat_stream(request: ChatRequest, http_request: Request):
+    logger.info("Received streaming chat request", session_id=request.session_id)
+    if not request.message.strip():
+        logger.warning("Empty message received", session_id=request.session_id)
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    history = await asyncio.to_thread(load_chat_history, request.session_id)
+    text_chunks = chat_with_agent_stream(
+        message=request.message,
+        session_id=request.session_id,
+        history=history,
+        use_cache="x-no-cache" not in http_request.headers
+    )
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return StreamingResponse(
+            sse_events(text_chunks),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    return StreamingResponse(text_chunks, media_type="text/plain; charset=utf-8")
+
+@app.post("/run-analysis", response_model=RunAnalysisResponse, response_model_exclude_none=True)
 async def handle_run_analysis(request: RunAnalysisRequest):
     logger.info(
         "Received /run-analysis request",
@@ -178,6 +236,32 @@ async def handle_run_analysis(request: RunAnalysisRequest):
             error=f"Error during market analysis: {str(e)}",
         )
 
+@app.post("/run-analysis/jobs", response_model=AnalysisJobResponse, status_code=202)
+async def handle_enqueue_run_analysis(request: RunAnalysisRequest):
+    logger.info(
+        "Received /run-analysis/jobs request",
+        query=request.query_str,
+        domain=request.market_domain_str,
+        question=request.question_str or "N/A"
+    )
+    job_id = await start_analysis_job(
+        query_str=request.query_str.strip(),
+        market_domain_str=request.market_domain_str.strip(),
+        question_str=request.question_str.strip() if request.question_str else None
+    )
+    return AnalysisJobResponse(job_id=job_id, status="queued")
+
+@app.get("/run-analysis/jobs/{job_id}", response_model=AnalysisJobResponse, response_model_exclude_none=True)
+async def handle_get_run_analysis_job(job_id: str):
+    job = await asyncio.to_thread(load_analysis_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return AnalysisJobResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        result=RunAnalysisResponse(**job["result"]) if job["result"] else None
+    )
+
 @app.get("/health", summary="Health Check")
 async def health_check():
     return {"status": "ok"}
@@ -185,7 +269,16 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
     logger.info("Running FastAPI app locally with Uvicorn")
-    init_agent_db()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
-
+    web_concurrency = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # "auto" picks uvloop and httptools when installed (uvicorn[standard], except uvloop on Windows).
+    # Extra workers need the import string and each load their own models; a single worker serves this module's app
+    # directly, so main.py is not imported a second time. The startup hook initialises the database.
+    uvicorn.run(
+        "main:app" if web_concurrency > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=web_concurrency,
+        log_config=None
+    )
@@ -0,0 +1,24 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def agent_logic(tmp_path_factory):
+    # Importing agent_logic creates its database and log files; both are kept out of the source tree
+    pytest.importorskip("langchain")
+    run_dir = tmp_path_factory.mktemp("agent_run")
+    os.environ["AGENT_DB_PATH"] = str(run_dir / "market_intelligence_agent.db")
+    os.environ["AGENT_PREWARM"] = "0"
+    previous_cwd = os.getcwd()
+    os.chdir(run_dir)
+    sys.path.insert(0, API_DIR)
+    try:
+        sys.modules.pop("agent_logic", None)
+        yield importlib.import_module("agent_logic")
+    finally:
+        os.chdir(previous_cwd)
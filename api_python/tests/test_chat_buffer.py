@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def _committed_rows(agent_logic, session_id):
+    with sqlite3.connect(agent_logic.get_db_path()) as conn:
+        return conn.execute(
+            "SELECT message_type, content FROM chat_history WHERE session_id = ? ORDER BY timestamp ASC", (session_id,)
+        ).fetchall()
+
+
+def _committed_timestamp(agent_logic, session_id):
+    with sqlite3.connect(agent_logic.get_db_path()) as conn:
+        return conn.execute("SELECT timestamp FROM chat_history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+
+def _buffered_rows(agent_logic, session_id):
+    with agent_logic._chat_write_lock:
+        return [chat_row for chat_row in agent_logic._chat_write_buffer if chat_row[0] == session_id]
+
+
+def _failing_insert(conn, rows_to_insert):
+    raise sqlite3.OperationalError("database is locked")
+
+
+def test_enqueue_then_flush_commits_rows(agent_logic):
+    session_id = str(uuid.uuid4())
+    agent_logic.save_chat_messages(session_id, [("human", "hi"), ("ai", "hello")])
+    assert agent_logic.flush_chat_messages()
+    assert _committed_rows(agent_logic, session_id) == [("human", "hi"), ("ai", "hello")]
+    assert not _buffered_rows(agent_logic, session_id)
+
+
+def test_load_while_flush_in_progress_sees_latest_exchange(agent_logic, monkeypatch):
+    session_id = str(uuid.uuid4())
+    insert_rows = agent_logic._insert_chat_rows
+
+    def slow_insert(conn, rows_to_insert):
+        time.sleep(0.2)
+        insert_rows(conn, rows_to_insert)
+
+    monkeypatch.setattr(agent_logic, "_insert_chat_rows", slow_insert)
+    agent_logic.save_chat_messages(session_id, [("human", "hi"), ("ai", "hello")])
+    flusher = threading.Thread(target=agent_logic.flush_chat_messages)
+    flusher.start()
+    time.sleep(0.05)
+    history = agent_logic.load_chat_history(session_id)
+    flusher.join()
+    assert history == [{"type": "human", "content": "hi"}, {"type": "ai", "content": "hello"}]
+
+
+def test_failed_flush_keeps_rows_buffered_and_visible(agent_logic, monkeypatch):
+    session_id = str(uuid.uuid4())
+    # High enough that the background flusher cannot drop the rows while the test runs
+    monkeypatch.setattr(agent_logic, "CHAT_FLUSH_MAX_ATTEMPTS", 1000)
+    insert_rows = agent_logic._insert_chat_rows
+    monkeypatch.setattr(agent_logic, "_insert_chat_rows", _failing_insert)
+    agent_logic.save_chat_messages(session_id, [("human", "hi"), ("ai", "hello")])
+    assert not agent_logic.flush_chat_messages()
+    assert len(_buffered_rows(agent_logic, session_id)) == 2
+    assert agent_logic.load_chat_history(session_id) == [
+        {"type": "human", "content": "hi"},
+        {"type": "ai", "content": "hello"},
+    ]
+
+    monkeypatch.setattr(agent_logic, "_insert_chat_rows", insert_rows)
+    assert agent_logic.flush_chat_messages()
+    assert _committed_rows(agent_logic, session_id) == [("human", "hi"), ("ai", "hello")]
+    assert not _buffered_rows(agent_logic, session_id)
+
+
+def test_failed_rows_are_dropped_after_max_attempts(agent_logic, monkeypatch):
+    session_id = str(uuid.uuid4())
+    monkeypatch.setattr(agent_logic, "CHAT_FLUSH_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(agent_logic, "_insert_chat_rows", _failing_insert)
+    agent_logic.save_chat_messages(session_id, [("human", "hi")])
+    agent_logic.flush_chat_messages()
+    agent_logic.flush_chat_messages()
+    assert not _buffered_rows(agent_logic, session_id)
+    assert not any(row_key[0] == session_id for row_key in agent_logic._chat_row_attempts)
+
+
+def test_integrity_error_rows_are_dropped_not_requeued(agent_logic):
+    session_id = str(uuid.uuid4())
+    agent_logic.save_chat_messages(session_id, [("human", "hi")])
+    assert agent_logic.flush_chat_messages()
+    duplicate_row = (session_id, "human", "duplicate", _committed_timestamp(agent_logic, session_id))
+    with agent_logic._chat_write_lock:
+        agent_logic._chat_write_buffer.append(duplicate_row)
+    agent_logic.save_chat_messages(session_id, [("ai", "hello")])
+    assert agent_logic.flush_chat_messages()
+    assert _committed_rows(agent_logic, session_id) == [("human", "hi"), ("ai", "hello")]
+    assert not _buffered_rows(agent_logic, session_id)
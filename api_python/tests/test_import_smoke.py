@@ -0,0 +1,9 @@
+import os
+
+
+def test_agent_logic_imports(agent_logic):
+    # Module-level code (decorators, table setup, constants) must run cleanly; main.py imports it on startup
+    assert callable(agent_logic.get_embeddings_model_tag)
+    assert callable(agent_logic.run_market_intelligence_agent)
+    assert agent_logic.get_db_path() == os.environ["AGENT_DB_PATH"]
+    assert os.path.exists(os.environ["AGENT_DB_PATH"])
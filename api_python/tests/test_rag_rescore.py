@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+faiss = pytest.importorskip("faiss")
+
+VECTOR_DIM = 32
+QUERY_TEXT = "query"
+
+
+class FixedEmbeddings(Embeddings):
+    # Chunk i sits at a growing distance from the query, so relevance scores spread across the 0.6 threshold
+    def __init__(self, chunk_count):
+        rng = np.random.default_rng(0)
+        self.query_vector = rng.normal(size=VECTOR_DIM).astype("float32")
+        self.vectors = {QUERY_TEXT: self.query_vector}
+        for chunk_idx in range(chunk_count):
+            noise = rng.normal(size=VECTOR_DIM).astype("float32")
+            self.vectors[f"chunk {chunk_idx}"] = self.query_vector + noise * chunk_idx * 0.15
+
+    def embed_documents(self, texts):
+        return [self.vectors[text].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text].tolist()
+
+
+def test_quantized_index_is_thresholded_on_exact_scores(agent_logic, monkeypatch):
+    chunk_count = 200
+    fixed_embeddings = FixedEmbeddings(chunk_count)
+    monkeypatch.setattr(agent_logic, "get_embeddings", lambda: fixed_embeddings)
+    monkeypatch.setattr(agent_logic, "FAISS_HNSW_MIN_VECTORS", 100)
+    texts = [f"chunk {chunk_idx}" for chunk_idx in range(chunk_count)]
+    vector_store = agent_logic.build_faiss_index(texts, [{} for _ in texts])
+    assert isinstance(vector_store.index, faiss.IndexHNSWSQ)
+
+    exact_vectors = np.asarray(fixed_embeddings.embed_documents(texts), dtype="float32")
+    faiss.normalize_L2(exact_vectors)
+    query_vector = np.asarray([fixed_embeddings.query_vector], dtype="float32")
+    faiss.normalize_L2(query_vector)
+    relevance_score_fn = vector_store._select_relevance_score_fn()
+    exact_scores = [relevance_score_fn(float(distance)) for distance in ((exact_vectors - query_vector) ** 2).sum(axis=1)]
+    expected = [texts[i] for i in sorted(range(chunk_count), key=lambda i: exact_scores[i], reverse=True)[:8] if exact_scores[i] >= agent_logic.RAG_SCORE_THRESHOLD]
+    assert 0 < len(expected) < 8
+
+    found = agent_logic.search_rag_documents(vector_store, QUERY_TEXT, 8)
+    assert [doc.page_content for doc in found] == expected